@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+''' Batch runner: runs many programs on a pool of worker processes, each with its own Interpreter and its
+    stdout and stderr captured, and checks each against the files next to it:
+        NAME.input          - fed to the program as stdin (otherwise stdin is empty)
+        NAME.expected       - what the program has to write to stdout
+        NAME.expected_error - the last line of the error the program has to fail with
+    A program passes if it finishes without an error (or with the expected one) and its stdout matches.
+'''
+import os
+import sys
+import glob
+import time
+import difflib
+import resource
+import tempfile
+import contextlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import parser
+import buffers
+
+
+INPUT_SUFFIX = '.input'
+EXPECTED_SUFFIX = '.expected'
+EXPECTED_ERROR_SUFFIX = '.expected_error'
+DIFF_LINES = 20     # lines of a failing diff which are reported
+
+# the outcome of one program: wall_time in seconds, peak_memory in KiB
+Result = namedtuple('Result', ['filename', 'passed', 'wall_time', 'peak_memory', 'stdout', 'stderr', 'problems'])
+
+
+def expand_paths(patterns):# {{{
+    ''' Returns the files named by patterns, each either a file name or a glob, without repeats
+    '''
+    filenames = []
+    for pattern in patterns:
+        if any(c in pattern for c in '*?['):
+            filenames += sorted(glob.glob(pattern))
+        else:
+            filenames.append(pattern)
+    return list(dict.fromkeys(filenames))# }}}
+
+def read_text(filename):# {{{
+    try:
+        with open(filename, 'r') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None# }}}
+
+
+##### peak memory #####
+#=====================#
+
+def reset_peak_memory():# {{{
+    ''' Resets the peak resident size of this process, so a worker measures each program on its own. Only
+        Linux can, elsewhere the peak is the worker's so far.
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass# }}}
+
+def peak_memory():# {{{
+    ''' Returns the peak resident size of this process in KiB
+    '''
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss# }}}
+
+
+##### workers #####
+#=================#
+
+@contextlib.contextmanager
+def redirected(stdin, stdout, stderr):# {{{
+    ''' Points descriptors 0, 1 and 2 at the given files while the block runs, with fresh I/O buffers
+    '''
+    saved = [os.dup(fd) for fd in (0, 1, 2)]
+    try:
+        for fd, f in zip((0, 1, 2), (stdin, stdout, stderr)):
+            os.dup2(f.fileno(), fd)
+        buffers.inputs = buffers.InputBuffers() # nothing read ahead by the last program
+        yield
+    finally:
+        for fd, saved_fd in zip((0, 1, 2), saved):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)# }}}
+
+def run_interpreter(interp, load=None):# {{{
+    ''' Runs interp, calling load() on it first if it's given, and returns the error it failed with, or None.
+        The error is written to descriptor 2, like ./interpreter would.
+    '''
+    try:
+        if load is not None:
+            load()
+        interp.run()
+    except Exception as e: # whatever the program failed with is its result, not the runner's
+        message = str(e).strip() or type(e).__name__
+        os.write(2, (message + '\n').encode('utf-8'))
+        return message
+    return None# }}}
+
+def new_interpreter(options):# {{{
+    return parser.Interpreter(options.vm, options.memo_size, not options.no_optimize,
+                              None if options.no_cache else options.cache_dir,
+                              stream=options.stream, module_path=options.module_path, lazy=options.lazy)# }}}
+
+def run_captured(filename, options, stdin, stdout, stderr):# {{{
+    ''' Runs filename on a new Interpreter with descriptors 0, 1 and 2 pointing at the given files, and
+        returns the error it failed with, or None
+    '''
+    with redirected(stdin, stdout, stderr):
+        buffers.configure_output(options.flush, options.buffer_size)
+        interp = new_interpreter(options)
+        return run_interpreter(interp, lambda: interp.load_file(filename))# }}}
+
+def run_program(filename, options):# {{{
+    ''' Runs one program in a worker and returns its Result
+    '''
+    base = os.path.splitext(filename)[0]
+    input_name = base + INPUT_SUFFIX
+    if not os.path.exists(input_name):
+        input_name = os.devnull
+
+    with open(input_name, 'rb') as stdin, tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        reset_peak_memory()
+        start = time.perf_counter()
+        error = run_captured(filename, options, stdin, out, err)
+        wall_time = time.perf_counter() - start
+        peak = peak_memory()
+        out.seek(0)
+        err.seek(0)
+        stdout = out.read().decode('utf-8', 'replace')
+        stderr = err.read().decode('utf-8', 'replace')
+
+    problems = []
+    expected_error = read_text(base + EXPECTED_ERROR_SUFFIX)
+    if expected_error is not None:
+        expected_error = expected_error.strip()
+        if error is None:
+            problems.append(f'expected to fail with: {expected_error}')
+        elif error.splitlines()[-1].strip() != expected_error:
+            problems.append(f'expected to fail with: {expected_error}')
+            problems.append(f'but failed with: {error.splitlines()[-1]}')
+    elif error is not None:
+        problems.append(f'failed with: {error.splitlines()[-1]}')
+
+    expected = read_text(base + EXPECTED_SUFFIX)
+    if expected is not None and expected != stdout:
+        diff = difflib.unified_diff(expected.splitlines(True), stdout.splitlines(True),
+                                    base + EXPECTED_SUFFIX, 'stdout')
+        problems += [line.rstrip('\n') for line in diff][:DIFF_LINES]
+    return Result(filename, not problems, wall_time, peak, stdout, stderr, problems)# }}}
+
+
+##### reporting #####
+#===================#
+
+def format_result(result):# {{{
+    status = 'PASS' if result.passed else 'FAIL'
+    lines = [f'{status}  {result.wall_time:8.3f}s  {result.peak_memory / 1024:7.1f} MiB  {result.filename}']
+    lines += ['      ' + problem for problem in result.problems]
+    return '\n'.join(lines)# }}}
+
+def run_batch(patterns, options, jobs=None):# {{{
+    ''' Runs every program named by patterns on jobs worker processes (one per CPU by default), prints a line
+        for each as it's reached in order, and a summary. Returns the list of Results.
+    '''
+    filenames = expand_paths(patterns)
+    start = time.perf_counter()
+    results = []
+    sys.stdout.flush() # the workers write to copies of our descriptors while they start up
+    with ProcessPoolExecutor(max_workers=jobs, initializer=parser.allow_long_integers) as executor:
+        for result in executor.map(run_program, filenames, [options] * len(filenames)):
+            results.append(result)
+            print(format_result(result), flush=True)
+
+    passed = sum(1 for r in results if r.passed)
+    elapsed = time.perf_counter() - start
+    print(f'{passed} passed, {len(results) - passed} failed in {elapsed:.2f}s '
+          f'(programs took {sum(r.wall_time for r in results):.2f}s in total)')
+    return results# }}}
@@ -0,0 +1,5 @@
+''' Benchmarks of the lexer, parser and evaluator, run from the top of the repository:
+
+    $ python3 -m bench [--only NAME ...] [--output results.json] [--compare baseline.json]
+    $ python3 bench/startup.py
+'''
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+''' Runs the workloads of bench/workloads.py, prints throughput, latency percentiles and allocations for
+    each, and optionally saves them as JSON or compares them with the JSON of an earlier run.
+'''
+import gc
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import tracemalloc
+import subprocess
+from bench.workloads import WORKLOADS
+
+DEFAULT_REPEAT = 20
+DEFAULT_THRESHOLD = 0.10    # a workload this much slower than the baseline is a regression
+
+
+def percentile(times, p):# {{{
+    ''' Nearest rank percentile of sorted times
+    '''
+    rank = max(0, min(len(times) - 1, round(p / 100 * len(times) + 0.5) - 1))
+    return times[rank]# }}}
+
+def measure_allocations(workload):# {{{
+    ''' Runs the workload once more with tracemalloc on, and returns the peak of memory allocated during the
+        run and the blocks still allocated after it. Not part of the timed runs, tracing slows them down.
+    '''
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        workload.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    return peak, sys.getallocatedblocks() - blocks# }}}
+
+def measure(workload, repeat):# {{{
+    ''' Sets up the workload, runs it once to warm up and repeat times timed, and returns its results
+    '''
+    workload.setup()
+    try:
+        workload.run()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            workload.run()
+            times.append(time.perf_counter() - start)
+        peak, blocks = measure_allocations(workload)
+    finally:
+        workload.teardown()
+
+    times.sort()
+    median = percentile(times, 50)
+    return {
+        'description': workload.description,
+        'unit': workload.unit,
+        'units': workload.units,
+        'runs': repeat,
+        'ops_per_sec': 1 / median,
+        'units_per_sec': workload.units / median,
+        'mean': sum(times) / len(times),
+        'min': times[0],
+        'p50': median,
+        'p90': percentile(times, 90),
+        'p99': percentile(times, 99),
+        'max': times[-1],
+        'alloc_peak_bytes': peak,
+        'retained_blocks': blocks,
+    }# }}}
+
+def git_commit():# {{{
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None# }}}
+
+
+##### reporting #####
+#===================#
+
+def format_result(name, r):# {{{
+    return (f"{name:<14} {r['units_per_sec']:>12,.0f} {r['unit'] + '/s':<12} {r['ops_per_sec']:>8.1f} ops/s"
+            f"  p50 {r['p50'] * 1000:8.2f} ms  p90 {r['p90'] * 1000:8.2f} ms  p99 {r['p99'] * 1000:8.2f} ms"
+            f"  alloc {r['alloc_peak_bytes'] / 1024:9.1f} KiB")# }}}
+
+def compare(results, baseline, threshold):# {{{
+    ''' Prints the change in throughput of each workload since baseline, and returns the names of the ones
+        slower by more than threshold
+    '''
+    regressions = []
+    print(f"\ncompared with {baseline['meta'].get('commit') or 'baseline'}:")
+    for name, r in results.items():
+        old = baseline['results'].get(name, None)
+        if old is None:
+            print(f'{name:<14} new')
+            continue
+        change = r['units_per_sec'] / old['units_per_sec'] - 1
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:<14} {change * 100:+7.1f}%{flag}')
+    return regressions# }}}
+
+def main():# {{{
+    names = [w.name for w in WORKLOADS]
+    argparser = argparse.ArgumentParser(prog='python3 -m bench', description=__doc__.splitlines()[0])
+    argparser.add_argument('--only', nargs='+', choices=names, metavar='NAME',
+                           help=f"workloads to run (default: all of {', '.join(names)})")
+    argparser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='timed runs of each workload')
+    argparser.add_argument('--scale', type=int, default=1, help='multiplies the size of every workload')
+    argparser.add_argument('--output', metavar='FILE', help='save the results as JSON')
+    argparser.add_argument('--compare', metavar='FILE', help='compare with the JSON results of an earlier run')
+    argparser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                           help='slowdown counted as a regression by --compare (default: 0.10)')
+    options = argparser.parse_args()
+
+    results = {}
+    for workload_class in WORKLOADS:
+        if options.only and workload_class.name not in options.only:
+            continue
+        results[workload_class.name] = r = measure(workload_class(options.scale), options.repeat)
+        print(format_result(workload_class.name, r), flush=True)
+
+    if options.output:
+        meta = {
+            'commit': git_commit(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': options.repeat,
+            'scale': options.scale,
+        }
+        with open(options.output, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+    if options.compare:
+        with open(options.compare, 'r') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, options.threshold):
+            sys.exit(1)# }}}
+
+
+if __name__ == '__main__':
+    main()
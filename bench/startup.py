@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+''' Startup time of ./interpreter with a cold cache (parsing the source) against a warm one (loading the
+    cached program), and without the cache but with --lazy (skimming function bodies). Generates a program
+    with many functions which only calls one of them, so the times are mostly lexing and parsing, or
+    loading the cache.
+
+    $ python3 bench/startup.py [--functions N] [--runs N]
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INTERPRETER = os.path.join(ROOT, 'interpreter')
+
+
+def generate_program(functions):# {{{
+    ''' Returns the source of a program defining the given number of functions and calling the last one
+    '''
+    lines = ['main', '', 'declarations', '{']
+    lines += [f'  (c) = f{i}(a, b);' for i in range(functions)]
+    lines += ['}', '', 'program', '{', f'  var x = f{functions - 1}(1, 2);', '  linux.write(1, x, 1);', '}', '',
+              'functions', '{']
+    for i in range(functions):
+        lines += [f'  (c) = f{i}(a, b)',
+                   '  {',
+                   '    var t = integer.add(a, b);',
+                   '    if(integer.equal(t, 3))',
+                   '    {',
+                   '      c = integer.multiply(t, 2);',
+                   '    }',
+                   '    else',
+                   '    {',
+                   '      c = integer.subtract(t, 1);',
+                   '    }',
+                   '  }']
+    lines.append('}')
+    return '\n'.join(lines) + '\n'# }}}
+
+def time_run(source, cache_dir, *options):# {{{
+    start = time.perf_counter()
+    subprocess.run([sys.executable, INTERPRETER, '--cache-dir', cache_dir, *options, source], check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start# }}}
+
+def main():# {{{
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argparser.add_argument('--functions', type=int, default=2000, help='functions in the generated program')
+    argparser.add_argument('--runs', type=int, default=5, help='runs of each kind')
+    options = argparser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='pleasant-bench-')
+    try:
+        source = os.path.join(workdir, 'startup.main')
+        cache_dir = os.path.join(workdir, 'cache')
+        with open(source, 'w') as f:
+            f.write(generate_program(options.functions))
+
+        cold, warm, lazy = [], [], []
+        for _ in range(options.runs):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            cold.append(time_run(source, cache_dir))
+            warm.append(time_run(source, cache_dir))
+            lazy.append(time_run(source, cache_dir, '--no-cache', '--lazy'))
+
+        print(f'{options.functions} functions, {os.path.getsize(source)} bytes of source, {options.runs} runs')
+        for name, times in (('cold', cold), ('warm', warm), ('lazy', lazy)):
+            print(f'  {name}: median {statistics.median(times) * 1000:8.1f} ms, min {min(times) * 1000:8.1f} ms')
+        print(f'  speedup: {statistics.median(cold) / statistics.median(warm):.2f}x warm, '
+              f'{statistics.median(cold) / statistics.median(lazy):.2f}x lazy')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)# }}}
+
+
+if __name__ == '__main__':
+    main()
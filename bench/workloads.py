@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+''' Generated workloads for the benchmarks. Each one builds its input once in setup(), and run() does one
+    timed operation, which processes units of work (tokens, statements, loop iterations, calls or syscalls).
+'''
+import os
+import tempfile
+import lexer
+import parser
+import buffers
+
+
+def program(declarations, body, functions):# {{{
+    ''' Returns the source of a main module from the lines of its three sections
+    '''
+    lines = ['main', '', 'declarations', '{'] + declarations + ['}', '', 'program', '{'] + body + ['}', '',
+             'functions', '{'] + functions + ['}']
+    return '\n'.join(lines) + '\n'# }}}
+
+def counting_loop(count, body):# {{{
+    ''' Lines of a while loop running body count times, with i counting up from 0
+    '''
+    return ['  var i = 0;',
+            f'  while(integer.equal(integer.equal(i, {count}), 0))',
+            '  {'] + body + [
+            '    i = integer.add(i, 1);',
+            '  }']# }}}
+
+
+class Workload:# {{{
+    ''' One benchmark. scale multiplies the size of the generated input.
+    '''
+    name = None
+    unit = None
+    description = None
+
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.units = 0 # units of work done by each run()
+
+    def setup(self):
+        pass
+
+    def run(self):
+        raise NotImplementedError
+
+    def teardown(self):
+        pass# }}}
+
+class ProgramWorkload(Workload):# {{{
+    ''' Runs a generated program, loaded and compiled once, on the closures or on the VM. Memoization is off,
+        so every run does the same work.
+    '''
+    use_vm = False
+
+    def source(self):
+        raise NotImplementedError
+
+    def setup(self):
+        self.interp = parser.Interpreter(use_vm=self.use_vm, memo_size=0)
+        self.interp.load(self.source())
+        self.interp.compile()
+
+    def run(self):
+        self.interp.run()# }}}
+
+
+##### lexer and parser #####
+#==========================#
+
+class LexFlat(Workload):# {{{
+    name = 'lex-flat'
+    unit = 'tokens'
+    description = 'tokenize a large flat program'
+
+    def setup(self):
+        count = 5000 * self.scale
+        body = [f'  var x{i} = integer.add(integer.multiply({i}, 3), "string {i}");' for i in range(count)]
+        self.text = program([], body, [])
+        self.units = len(lexer.tokenize(self.text))
+
+    def run(self):
+        for _ in lexer.iter_tokens(self.text):
+            pass# }}}
+
+class ParseFlat(LexFlat):# {{{
+    name = 'parse-flat'
+    unit = 'tokens'
+    description = 'tokenize and parse a large flat program'
+
+    def run(self):
+        parser.Parser(self.text, parser.builtin_functions(), []).parse()# }}}
+
+class ParseNested(Workload):# {{{
+    name = 'parse-nested'
+    unit = 'statements'
+    description = 'parse blocks nested 60 deep, many times over'
+
+    def setup(self):
+        depth = 60
+        body = []
+        for _ in range(20 * self.scale):
+            for d in range(depth):
+                body += ['  ' * d + '  if(integer.equal(x, 0))', '  ' * d + '  {']
+            body.append('  ' * depth + '  x = integer.add(x, 1);')
+            for d in reversed(range(depth)):
+                body.append('  ' * d + '  }')
+        self.text = program([], ['  var x = 0;'] + body, [])
+        self.units = 1 + 20 * self.scale * (depth + 1)
+
+    def run(self):
+        parser.Parser(self.text, parser.builtin_functions(), []).parse()# }}}
+
+
+##### evaluation #####
+#====================#
+
+class WhileLoop(ProgramWorkload):# {{{
+    name = 'while-loop'
+    unit = 'iterations'
+    description = 'tight while loop adding to a counter'
+
+    def source(self):
+        count = 100000 * self.scale
+        self.units = count
+        body = ['  var total = 0;'] + counting_loop(count, ['    total = integer.add(total, i);'])
+        return program([], body, [])# }}}
+
+class WhileLoopVM(WhileLoop):# {{{
+    name = 'while-loop-vm'
+    use_vm = True# }}}
+
+class Recursion(ProgramWorkload):# {{{
+    name = 'recursion'
+    unit = 'calls'
+    description = 'deep recursion which is not a tail call'
+
+    def source(self):
+        depth = 5000 * self.scale
+        self.units = depth + 1
+        functions = ['  (s) = sum(n)',
+                     '  {',
+                     '    if(integer.equal(n, 0))',
+                     '    {',
+                     '      s = 0;',
+                     '    }',
+                     '    else',
+                     '    {',
+                     '      var t = sum(integer.subtract(n, 1));',
+                     '      s = integer.add(n, t);',
+                     '    }',
+                     '  }']
+        return program(['  (s) = sum(n);'], [f'  var s = sum({depth});'], functions)# }}}
+
+class RecursionVM(Recursion):# {{{
+    name = 'recursion-vm'
+    use_vm = True# }}}
+
+class VectorSum(ProgramWorkload):# {{{
+    name = 'vector-sum'
+    unit = 'items'
+    description = 'vector.map_add, vector.add and vector.sum over a large vector'
+
+    def source(self):
+        count = 100000 * self.scale
+        self.units = 3 * count
+        body = [f'  var v = vector.new({count});',
+                '  var w = vector.map_add(v, 7);',
+                '  var u = vector.add(v, w);',
+                '  var total = vector.sum(u);']
+        return program([], body, [])# }}}
+
+class MapLookup(ProgramWorkload):# {{{
+    name = 'map-lookup'
+    unit = 'operations'
+    description = 'map.put then map.get of every key of a large integer keyed map'
+
+    def source(self):
+        count = 100000 * self.scale
+        self.units = 2 * count
+        body = (['  var m = map.new();', '  var total = 0;'] +
+                counting_loop(count, ['    map.put(m, integer.multiply(i, 7919), i);']) +
+                counting_loop(count, ['    total = integer.add(total, map.get(m, integer.multiply(i, 7919)));']))
+        return program([], body, [])# }}}
+
+
+##### I/O #####
+#=============#
+
+class WriteLoop(ProgramWorkload):# {{{
+    name = 'io-write'
+    unit = 'writes'
+    description = 'linux.write in a loop, to /dev/null'
+
+    def source(self):
+        count = 50000 * self.scale
+        self.units = count
+        return program([], counting_loop(count, ['    linux.write(1, "a line of output\\n", 17);']), [])
+
+    def setup(self):
+        ProgramWorkload.setup(self)
+        self.saved = os.dup(1)
+        null = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(null, 1)
+        os.close(null)
+        buffers.configure_output('size')
+
+    def teardown(self):
+        buffers.output.flush_all()
+        os.dup2(self.saved, 1)
+        os.close(self.saved)
+        buffers.configure_output()# }}}
+
+class ReadLoop(ProgramWorkload):# {{{
+    name = 'io-read'
+    unit = 'reads'
+    description = 'linux.read of 64 bytes at a time from a 2 MiB file on stdin'
+
+    def source(self):
+        size = 2 * 1024 * 1024 * self.scale
+        self.units = size // 64 + 1
+        fd, self.path = tempfile.mkstemp(prefix='pleasant-bench-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'0123456789abcdef' * (size // 16))
+        body = ['  var count = 1;',
+                '  var buffer = "";',
+                '  while(integer.equal(integer.equal(count, 0), 0))',
+                '  {',
+                '    (count, buffer) = linux.read(0, 64);',
+                '  }']
+        return program([], body, [])
+
+    def setup(self):
+        ProgramWorkload.setup(self)
+        self.saved = os.dup(0)
+
+    def run(self):
+        fd = os.open(self.path, os.O_RDONLY) # read from the start again
+        os.dup2(fd, 0)
+        os.close(fd)
+        buffers.inputs.forget(0)
+        self.interp.run()
+
+    def teardown(self):
+        os.dup2(self.saved, 0)
+        os.close(self.saved)
+        buffers.inputs.forget(0)
+        os.remove(self.path)# }}}
+
+
+WORKLOADS = [LexFlat, ParseFlat, ParseNested, WhileLoop, WhileLoopVM, Recursion, RecursionVM, VectorSum,
+             MapLookup, WriteLoop, ReadLoop]
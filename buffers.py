@@ -0,0 +1,267 @@
+#!/usr/bin/python3
+''' Buffered I/O behind the linux.* builtins, so a program writing in a loop doesn't make a syscall per call
+'''
+import os
+import stat
+import mmap
+import codecs
+import threading
+from lexer import fail
+import tasks
+
+
+FLUSH_POLICIES = ['none', 'line', 'size', 'exit']
+DEFAULT_BUFFER_SIZE = 64 * 1024
+READ_AHEAD_SIZE = 1024 * 1024
+
+
+class OutputBuffers:# {{{
+    ''' One bytearray per file descriptor, flushed according to a policy:
+            none - every write goes straight to os.write
+            line - when a newline is written, or the buffer is full
+            size - when the buffer is full
+            exit - only by flush_all, at the end of the program (or when it fails)
+        Without an explicit policy, stderr isn't buffered, terminals are line buffered and everything else
+        is flushed by size, like C stdio. The buffers belong to the process, like the descriptors, so
+        programs running side by side on several threads share them, under a lock.
+    '''
+    def __init__(self, policy=None, size=DEFAULT_BUFFER_SIZE):
+        if policy is not None and policy not in FLUSH_POLICIES:
+            fail(f"Unknown flush policy '{policy}', expected one of {', '.join(FLUSH_POLICIES)}")
+        self.policy = policy
+        self.size = size
+        self.buffers = {} # fd -> bytearray
+        self.policies = {} # fd -> policy
+        self.lock = threading.RLock()
+
+    def policy_for(self, fd):
+        try:
+            os.fstat(fd) # fail on the first write to a bad descriptor, not when it's flushed
+        except OSError:
+            fail(f'Writing to {fd} failed')
+        if self.policy is not None:
+            return self.policy
+        if fd == 2:
+            return 'none'
+        if os.isatty(fd):
+            return 'line'
+        return 'size'
+
+    def write(self, fd, text):
+        with self.lock:
+            buf = self.buffers.get(fd, None)
+            if buf is None:
+                buf = self.buffers[fd] = bytearray()
+                self.policies[fd] = self.policy_for(fd)
+            buf += text.encode('utf-8')
+            policy = self.policies[fd]
+            due = policy == 'none' or (len(buf) >= self.size and policy != 'exit') or (policy == 'line' and '\n' in text)
+        if due:
+            if tasks.active: # a task waits for room outside the lock, so the other tasks can write meanwhile
+                tasks.wait_writable(fd)
+            self.flush(fd)
+
+    def flush(self, fd):
+        with self.lock:
+            buf = self.buffers.get(fd, None)
+            if not buf:
+                return
+            view = memoryview(buf)
+            written = 0
+            try:
+                while written < len(buf): # os.write can write less than it's given, e.g. on pipes
+                    written += os.write(fd, view[written:])
+            except OSError:
+                fail(f'Writing to {fd} failed')
+            finally:
+                view.release()
+                del buf[:written]
+
+    def flush_all(self):
+        with self.lock:
+            for fd in list(self.buffers.keys()):
+                self.flush(fd)# }}}
+
+
+output = OutputBuffers()
+
+def configure_output(policy=None, size=DEFAULT_BUFFER_SIZE):# {{{
+    ''' Replaces the output buffers with ones using the given flush policy and buffer size, after flushing
+        whatever is buffered
+    '''
+    global output
+    output.flush_all()
+    output = OutputBuffers(policy, size)# }}}
+
+
+class InputBuffer:# {{{
+    ''' Read-ahead buffer of one file descriptor. Regular files are memory mapped from the current offset, so
+        reads are slices of the mapping. The descriptor's offset is moved past what's been read, so whatever
+        else reads it (os.read, a child process) carries on from there, and the file is mapped again once
+        it's grown past the mapping. Anything else (pipes, terminals) is read READ_AHEAD_SIZE bytes at a
+        time, and reads are served from that chunk until it runs out. Bytes are decoded as UTF-8, keeping a
+        partial character for the next read.
+    '''
+    def __init__(self, fd, size=READ_AHEAD_SIZE):
+        self.fd = fd
+        self.size = size
+        self.data = b''
+        self.pos = 0
+        self.mapped = False # a regular file, read through a mapping of it, which never blocks
+        self.eof = False
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            info = os.fstat(fd)
+        except OSError:
+            fail(f'Reading from {fd} failed')
+        if stat.S_ISREG(info.st_mode):
+            self.pos = os.lseek(fd, 0, os.SEEK_CUR)
+            self.mapped = True
+            self.remap()
+
+    def remap(self):
+        ''' Maps the file again if it's grown past the mapping (or there's none yet), returns True if it has
+        '''
+        try:
+            size = os.fstat(self.fd).st_size
+        except OSError:
+            fail(f'Reading from {self.fd} failed')
+        if size <= len(self.data):
+            return False
+        self.data = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+        return True
+
+    def consumed(self):
+        ''' Moves a mapped file's offset past what's been read, as reading it with os.read would have
+        '''
+        if self.mapped:
+            os.lseek(self.fd, self.pos, os.SEEK_SET)
+
+    def ready(self, line=False):
+        ''' True if a read (or a readline) can be served without blocking
+        '''
+        if self.eof or self.mapped:
+            return True
+        if line:
+            return self.data.find(b'\n', self.pos) != -1
+        return self.pos < len(self.data)
+
+    def read_more(self):
+        ''' Appends the next chunk to what's left unread, once the descriptor has input
+        '''
+        try:
+            chunk = os.read(self.fd, self.size)
+        except OSError:
+            fail(f'Reading from {self.fd} failed')
+        if not chunk:
+            self.eof = True
+            return
+        self.data = self.data[self.pos:] + chunk
+        self.pos = 0
+
+    def refill(self):
+        ''' Reads the next chunk once the current one is used up, returns False at the end of the input
+        '''
+        if self.pos < len(self.data):
+            return True
+        if self.mapped: # at the end for now, unless the file has grown
+            output.flush_all() # which it may have from our own writes
+            return self.remap() and self.pos < len(self.data)
+        if self.eof:
+            return False
+        output.flush_all() # so a prompt is out before we block on input
+        try:
+            self.data = os.read(self.fd, self.size)
+        except OSError:
+            fail(f'Reading from {self.fd} failed')
+        self.pos = 0
+        if not self.data:
+            self.eof = True
+            return False
+        return True
+
+    def read(self, numbytes):
+        ''' Returns the text of the next numbytes bytes at most. Like os.read, it may return less than asked
+            (but at least one character) without waiting, and returns '' only at the end of the input, or
+            when numbytes is 0.
+        '''
+        if not isinstance(numbytes, int) or numbytes < 0:
+            fail(f'linux.read: can\'t read {numbytes!r} bytes from {self.fd}')
+        if numbytes == 0:
+            return ''
+        while self.refill():
+            chunk = self.data[self.pos:self.pos + numbytes]
+            self.pos += len(chunk)
+            text = self.decoder.decode(chunk)
+            if text: # otherwise chunk ended in the middle of a character
+                self.consumed()
+                return text
+        self.consumed()
+        return self.decoder.decode(b'', final=True)
+
+    def readline(self):
+        ''' Returns the next line including its newline, or the rest of the input if there's no newline left
+        '''
+        parts = []
+        while self.refill():
+            end = self.data.find(b'\n', self.pos)
+            if end != -1:
+                parts.append(self.data[self.pos:end + 1])
+                self.pos = end + 1
+                break
+            parts.append(self.data[self.pos:])
+            self.pos = len(self.data)
+        self.consumed()
+        return self.decoder.decode(b''.join(parts), final=not parts)# }}}
+
+
+class InputBuffers:# {{{
+    ''' An InputBuffer for each file descriptor read with linux.read or linux.readline, shared by every
+        program in the process like OutputBuffers
+    '''
+    def __init__(self, size=READ_AHEAD_SIZE):
+        self.size = size
+        self.buffers = {}
+        self.lock = threading.Lock()
+
+    def get(self, fd):
+        buf = self.buffers.get(fd, None)
+        if buf is None:
+            buf = self.buffers[fd] = InputBuffer(fd, self.size)
+        return buf
+
+    def read(self, fd, numbytes):
+        if tasks.active and numbytes != 0: # reading nothing never waits
+            self.wait(fd)
+        with self.lock:
+            return self.get(fd).read(numbytes)
+
+    def readline(self, fd):
+        if tasks.active:
+            self.wait(fd, line=True)
+        with self.lock:
+            return self.get(fd).readline()
+
+    def wait(self, fd, line=False):
+        ''' Suspends the running task (see tasks.py) until reading fd wouldn't block, reading what comes in
+            meanwhile. The lock isn't held while it's suspended, so the other tasks can read too.
+        '''
+        while True:
+            with self.lock:
+                buf = self.get(fd)
+                if buf.ready(line):
+                    return
+            output.flush_all() # so a prompt is out before we wait for input
+            if not tasks.wait_readable(fd):
+                return # not a task, or fd can't be waited for, so it's read as usual
+            with self.lock:
+                buf.read_more()
+
+    def forget(self, fd):
+        ''' Drops the buffer of fd, e.g. once it's closed, so a new file with the same number starts fresh
+        '''
+        with self.lock:
+            self.buffers.pop(fd, None)# }}}
+
+
+inputs = InputBuffers()
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+''' On-disk cache of parsed programs, so running an unchanged file skips the lexer and parser.
+    The tree is stored as nested tuples of ints and strings written with marshal, not as pickled objects.
+'''
+import os
+import sys
+import marshal
+import hashlib
+import threading
+import parser
+
+
+DEFAULT_CACHE_DIR = os.environ.get('PLEASANT_CACHE_DIR',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'pleasant'))
+CACHE_SUFFIX = '.plc'
+
+# expression and statement tags
+VALUE, VARIABLE, CALL, OPERATION = 0, 1, 2, 3
+DECLARE, ASSIGN, WHILE, IF_ELSE, CALL_STATEMENT, BLOCK = 0, 1, 2, 3, 4, 5
+EXPRESSION_TAGS = {'value': VALUE, 'variable': VARIABLE, 'function': CALL, 'operation': OPERATION}
+EXPRESSION_KINDS = {tag: kind for kind, tag in EXPRESSION_TAGS.items()}
+
+
+def source_key(text):# {{{
+    ''' The key a cached program has to match: the source (a string, or the bytes of the file), the
+        interpreter version and the Python version (marshal's format can change between Python versions)
+    '''
+    digest = hashlib.sha256(text.encode('utf-8') if isinstance(text, str) else text)
+    digest.update(f'\0{parser.VERSION}\0{sys.version_info[0]}.{sys.version_info[1]}'.encode())
+    return digest.hexdigest()# }}}
+
+def cache_path(cache_dir, filename):# {{{
+    ''' Each source file has one cache entry, named after its absolute path, so a changed file replaces
+        its stale entry instead of leaving it behind
+    '''
+    name = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, name + CACHE_SUFFIX)# }}}
+
+
+##### encoding #####
+#==================#
+
+def encode_expression(e):# {{{
+    args = tuple(encode_expression(a) for a in e.args) if e.args is not None else None
+    return (EXPRESSION_TAGS[e.kind], e.value, e.name, args, e.linenum)# }}}
+
+def encode_block(statements):# {{{
+    encoded = []
+    for s in statements:
+        if isinstance(s, list):
+            encoded.append((BLOCK, encode_block(s)))
+        elif isinstance(s, parser.VariableDeclaration):
+            encoded.append((DECLARE, tuple(s.names), encode_expression(s.expr), s.linenum))
+        elif isinstance(s, parser.AssignStatement):
+            encoded.append((ASSIGN, tuple(s.names), encode_expression(s.expr), s.linenum))
+        elif isinstance(s, parser.WhileStatement):
+            encoded.append((WHILE, encode_expression(s.condition), encode_block(s.statements), s.linenum))
+        elif isinstance(s, parser.IfElseStatement):
+            false_statements = encode_block(s.false_statements) if s.false_statements is not None else None
+            encoded.append((IF_ELSE, encode_expression(s.condition), encode_block(s.true_statements),
+                            false_statements, s.linenum))
+        elif isinstance(s, parser.FunctionCallStatement):
+            encoded.append((CALL_STATEMENT, s.name, tuple(encode_expression(a) for a in s.args), s.linenum))
+    return tuple(encoded)# }}}
+
+def encode_program(functions, statements, header):# {{{
+    ''' Encodes the functions and statements the parser just built, and the header of the source (see
+        parser.Parser.header). Imported modules aren't linked in yet, so only the source's own functions are.
+    '''
+    encoded = []
+    for func in functions.values():
+        if isinstance(func, parser.Function):
+            body = encode_block(func.statements) if func.is_defined() else None
+            encoded.append((func.name, tuple(func.inputs.keys()), tuple(func.outputs.keys()), body))
+    module_name, imports, exports = header
+    return (tuple(encoded), encode_block(statements), (module_name, tuple(imports), tuple(exports)))# }}}
+
+
+##### decoding #####
+#==================#
+
+def decode_expression(e):# {{{
+    tag, value, name, args, linenum = e
+    if args is not None:
+        args = [decode_expression(a) for a in args]
+    return parser.Expression(EXPRESSION_KINDS[tag], value, name, args, linenum)# }}}
+
+def decode_block(encoded):# {{{
+    statements = []
+    for s in encoded:
+        tag = s[0]
+        if tag == BLOCK:
+            statements.append(decode_block(s[1]))
+        elif tag == DECLARE:
+            statements.append(parser.VariableDeclaration(list(s[1]), decode_expression(s[2]), s[3]))
+        elif tag == ASSIGN:
+            statements.append(parser.AssignStatement(list(s[1]), decode_expression(s[2]), s[3]))
+        elif tag == WHILE:
+            statements.append(parser.WhileStatement(decode_expression(s[1]), decode_block(s[2]), s[3]))
+        elif tag == IF_ELSE:
+            false_statements = decode_block(s[3]) if s[3] is not None else None
+            statements.append(parser.IfElseStatement(decode_expression(s[1]), decode_block(s[2]), false_statements,
+                                                     s[4]))
+        elif tag == CALL_STATEMENT:
+            statements.append(parser.FunctionCallStatement(s[1], [decode_expression(a) for a in s[2]], s[3]))
+    return statements# }}}
+
+def decode_program(encoded, functions, statements):# {{{
+    ''' Adds the decoded functions to the function table and the decoded program section to statements, as
+        if the parser had just run, and returns the decoded header
+    '''
+    encoded_functions, encoded_statements, (module_name, imports, exports) = encoded
+    for name, inputs, outputs, body in encoded_functions:
+        body = decode_block(body) if body is not None else None
+        inputs, outputs = dict.fromkeys(inputs, ''), dict.fromkeys(outputs, '')
+        functions[name] = parser.Function(name, inputs, outputs, body)
+    statements[:] = decode_block(encoded_statements)
+    return module_name, list(imports), list(exports)# }}}
+
+
+##### files #####
+#===============#
+
+def load(cache_dir, filename, text, functions, statements):# {{{
+    ''' Loads the cached program of filename into the function table and statement list, and returns its
+        header. Returns None if there's no entry or it's stale (made from another source text or by another
+        interpreter version).
+    '''
+    try:
+        with open(cache_path(cache_dir, filename), 'rb') as f:
+            key, encoded = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if key != source_key(text):
+        return None
+    return decode_program(encoded, functions, statements)# }}}
+
+def store(cache_dir, filename, text, functions, statements, header):# {{{
+    ''' Writes the program the parser just built into functions and statements to the cache, with its
+        header. Failing to write is ignored, the next run just parses again.
+    '''
+    path = cache_path(cache_dir, filename)
+    temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp' # servers and batches store from many threads
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(temp, 'wb') as f:
+            marshal.dump((source_key(text), encode_program(functions, statements, header)), f)
+        os.replace(temp, path) # atomic, so a concurrent run never reads half an entry
+    except (OSError, ValueError):
+        try:
+            os.remove(temp)
+        except OSError:
+            pass# }}}
+
+def clear(cache_dir):# {{{
+    ''' Removes every cache entry in cache_dir, returns how many were removed
+    '''
+    removed = 0
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return 0
+    for name in names:
+        if name.endswith(CACHE_SUFFIX):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+                removed += 1
+            except OSError:
+                pass
+    return removed# }}}
@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+''' Thin client of the interpreter server (see server.py). Sends the path of a program and everything on
+    stdin to the server, and writes back the program's stdout and stderr, exiting with its status. It only
+    imports what talking to the socket takes, so it starts in a fraction of the time ./interpreter does.
+
+    $ ./client.py SOCKET <source_file.main> < input
+'''
+import os
+import sys
+import json
+import struct
+import socket
+
+HEADER = struct.Struct('!Q') # every message is a length, then that many bytes
+
+
+##### protocol #####
+#==================#
+
+def send_message(sock, data):# {{{
+    sock.sendall(HEADER.pack(len(data)) + data)# }}}
+
+def receive_exactly(sock, size):# {{{
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError('the connection closed in the middle of a message')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)# }}}
+
+def receive_message(sock):# {{{
+    size, = HEADER.unpack(receive_exactly(sock, HEADER.size))
+    return receive_exactly(sock, size)# }}}
+
+def request(socket_path, filename, stdin):# {{{
+    ''' Runs filename on the server at socket_path with stdin (bytes) as its input, and returns its
+        (status, stdout, stderr)
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        send_message(sock, json.dumps({'path': os.path.abspath(filename)}).encode('utf-8'))
+        send_message(sock, stdin)
+        status = json.loads(receive_message(sock))['status']
+        return status, receive_message(sock), receive_message(sock)# }}}
+
+
+def main():# {{{
+    if len(sys.argv) != 3:
+        print(f'usage: {sys.argv[0]} SOCKET <source_file.main>', file=sys.stderr)
+        sys.exit(2)
+    stdin = b'' if sys.stdin.isatty() else sys.stdin.buffer.read()
+    try:
+        status, stdout, stderr = request(sys.argv[1], sys.argv[2], stdin)
+    except OSError as e:
+        print(f'Could not reach the server at {sys.argv[1]}: {e}', file=sys.stderr)
+        sys.exit(2)
+    sys.stdout.buffer.write(stdout)
+    sys.stdout.flush()
+    sys.stderr.buffer.write(stderr)
+    sys.exit(status)# }}}
+
+
+if __name__ == '__main__':
+    main()
@@ -2,143 +2,153 @@ import itertools as it
 import functools as ft
 import re
 import sys
+from collections import namedtuple, deque
 
 
-global linenumber
-global charnumber
-linenumber = 1
-charnumber = 0
+# a single lexed token: kind is one of 'char', 'string', 'identifier' or 'number', offset is where it starts
+# in the source (in bytes, if the source is bytes)
+Token = namedtuple('Token', ['kind', 'text', 'line', 'column', 'offset'])
 
 # Interface for eating tokens, Class Tokenizer
 class Tokenizer:# {{{
-    def __init__(self, string):
-        self.string = string 
+    ''' Pulls tokens from iter_tokens() as the parser asks for them, keeping only the ones it has looked
+        ahead at, so memory doesn't grow with the size of the source. linenumber and charnumber are the
+        position of the last token consumed, for statements and errors.
+    '''
+    def __init__(self, source, offset=0, line=1, column=1):
+        self.tokens = deque() # tokens looked ahead at, but not consumed yet
+        self.stream = iter_tokens(source, offset, line, column)
         self.token = None
+        self.linenumber = line
+        self.charnumber = 0
+
+    def fill(self, count):
+        ''' Looks ahead until count tokens are waiting, returns False if the source runs out first
+        '''
+        tokens = self.tokens
+        while len(tokens) < count:
+            tok = next(self.stream, None)
+            if tok is None:
+                return False
+            tokens.append(tok)
+        return True
+
+    def peek(self, offset=0):
+        if len(self.tokens) > offset or self.fill(offset + 1):
+            return self.tokens[offset].text
+        return None
+
+    def next_token(self):
+        ''' Returns the Token which would be consumed next, or None at the end of the source
+        '''
+        if self.tokens or self.fill(1):
+            return self.tokens[0]
+        return None
 
     def try_lookahead(self, wanted):
-        token, temp = consume_token(self.string)
-        next_token, _ = consume_token(temp)
-        return wanted == next_token
+        return wanted == self.peek(1)
 
     def try_match(self, wanted):
-        token, _ = consume_token(self.string)
-        return wanted == token
+        return wanted == self.peek()
 
     def must_match(self, wanted):
-        global charnumber
-        token, rest = consume_token(self.string, update_pos=True)
-        if not self.try_match(wanted):
-            charnumber -= (len(token) - 1)
-            fail(f"Token '{wanted}' expected, but received '{token}'")
-        self.string = rest
-        return token, rest
+        token = self.peek()
+        if wanted != token:
+            self.fail_at_current()
+            self.fail(f"Token '{wanted}' expected, but received '{token}'")
+        self.advance()
+        return token, None
 
     def try_match_regex(self, regex):
-        token, rest = consume_token(self.string)
-        match = re.match(regex, token)
-        return bool(match)
+        token = self.peek()
+        if token is None:
+            return False
+        return bool(re.match(regex, token))
 
     def must_match_regex(self, regex):
-        global charnumber
-        token, rest = consume_token(self.string, update_pos=True)
-        match = re.match(regex, token)
-        if match is None:
-            charnumber -= (len(token) - 1)
-            fail(f"Regex {regex} expected, but no match!")
-        self.string = rest
-        return token# }}}
-
-
-# Following functions are for tokenizing text
-def consume_identifier(string):# {{{
-    identifier = '[a-zA-Z][a-zA-Z0-9._]*'
-    match = re.match(identifier, string)
-    if match:
-        return match.group(0), string[match.end():]
-    return None, string# }}}
-
-def consume_number(string):# {{{
-    num = re.compile('-?\d+')
-    match = re.match(num, string)
-    if match is None:
-        return None, string
-    return string[:match.end()], string[match.end():] # }}}
-
-def consume_string(mstr, string):# {{{
-    if string.startwith(mstr):
-        return mstr, string[len(mstr):]
-    return None, string# }}}
-
-def strip_ws(string, update_pos=False):# {{{
-    global linenumber, charnumber
-    rest = string.lstrip()
-    deleted = string[:len(string) - len(rest)]
-    if update_pos:
-        # adjust newline count and char count
-        newlines = deleted.count('\n')
-        last_newline = deleted[::-1].find('\n')
-        # move the char marker up for each space 
-        if newlines > 0:
-            linenumber += newlines
-            charnumber = last_newline
-    return deleted, rest# }}}
-
-def consume_string_literal(string):# {{{
-    if string[0] == '"':
-        close = string[1:].index('"')
-        return string[:close+2], string[close+2:]
-    return None, string# }}}
-
-def consume_comment(string):# {{{
-    if string[0] == '#':
-        newline = string.find('\n')
-        if newline == -1:
-            return string, None
-        return string[:newline], string[newline:]
-    return None, string# }}}
-
-def consume_char_tokens(string):# {{{
-    char_tokens = [ '{', '}', '(', ')', '=', ',', ';']
-    if string[0] in char_tokens:
-        return string[0], string[1:]
-    return None, string# }}}
-
-# consume whatever the next token happens to be, fail otherwise
-def consume_token(string, update_pos=False):# {{{
-    global charnumber
-    global linenumber
-    ws, string = strip_ws(string, update_pos)
-    if not string:
-        return None, None
-    # delete comment if it's there
-    comment, string = consume_comment(string)
-    while comment:
-        ws, string = strip_ws(string, update_pos)
-        comment, string = consume_comment(string)
-    if string is None:
-        return None, None
-
-    # is the first character important???
-    token, string = consume_char_tokens(string)
-    if token:
-        charnumber += len(token) * update_pos
-        return token, string
-    # is there a string literal "I am a string"???
-    token, string = consume_string_literal(string)
-    if token:
-        charnumber += len(token) * update_pos
-        return token, string
-    # is there an identifier (alpha + alnum)???
-    token, string = consume_identifier(string)
-    if token:
-        charnumber += len(token) * update_pos
-        return token, string
-    # is there a number???
-    token, string = consume_number(string)
-    if token:
-        charnumber += len(token) * update_pos
-        return token, string
-    fail(f"Not sure what to make of this: not comment, string, identifier, or integer: {string[:50]}...")# }}}
+        token = self.peek()
+        if token is None or re.match(regex, token) is None:
+            self.fail_at_current()
+            self.fail(f"Regex {regex} expected, but no match!")
+        self.advance()
+        return token
+
+    def advance(self):
+        ''' Consumes the current token and moves the position markers past it
+        '''
+        tok = self.tokens.popleft()
+        self.linenumber = tok.line
+        self.charnumber = tok.column + len(tok.text) - 1
+        self.token = tok.text
+
+    def fail_at_current(self):
+        tok = self.next_token()
+        if tok is not None:
+            self.linenumber, self.charnumber = tok.line, tok.column
+
+    def fail(self, message):
+        fail(message, self.linenumber, self.charnumber)# }}}
+
+
+# Following is for tokenizing text
+TOKEN_PATTERN = r'''
+    (?P<ws>[ \t\r\f\v]+)
+  | (?P<newline>\n)
+  | (?P<comment>\#[^\n]*)
+  | (?P<char>[{}()=,;])
+  | (?P<string>"[^"]*")
+  | (?P<identifier>[a-zA-Z][a-zA-Z0-9._]*)
+  | (?P<number>-?\d+)
+'''
+TOKEN_REGEX = re.compile(TOKEN_PATTERN, re.VERBOSE)
+TOKEN_BYTES_REGEX = re.compile(TOKEN_PATTERN.encode('ascii'), re.VERBOSE) # for bytes and memory mapped files
+
+def iter_tokens(source, offset=0, line=1, column=1):# {{{
+    ''' Scans source from offset, yielding its Tokens one at a time. source is a string, or bytes-like (such
+        as an mmap of the file), which is matched in place and only decoded a token at a time. Line and column
+        numbers are 1-based, columns count from the start of the line; line and column are the position of
+        offset.
+    '''
+    binary = not isinstance(source, str)
+    match = (TOKEN_BYTES_REGEX if binary else TOKEN_REGEX).match
+    newline = b'\n' if binary else '\n'
+    pos = offset
+    line_start = offset - column + 1
+    end = len(source)
+    while pos < end:
+        m = match(source, pos)
+        if m is None:
+            column = pos - line_start + 1
+            rest = source[pos:pos+50]
+            if binary:
+                rest = rest.decode('utf-8', 'replace')
+            if rest.startswith('"'):
+                fail("Unterminated string literal", line, column)
+            fail(f"Not sure what to make of this: not comment, string, identifier, or integer: {rest}...",
+                    line, column)
+        kind = m.lastgroup
+        if kind == 'newline':
+            line += 1
+            line_start = m.end()
+        elif kind == 'string':
+            raw = m.group()
+            text = raw.decode('utf-8', 'replace') if binary else raw
+            yield Token(kind, text, line, pos - line_start + 1, pos)
+            newlines = raw.count(newline)
+            if newlines:
+                line += newlines
+                line_start = pos + raw.rfind(newline) + 1
+        elif kind != 'ws' and kind != 'comment':
+            text = m.group()
+            if binary:
+                text = text.decode('ascii')
+            yield Token(kind, text, line, pos - line_start + 1, pos)
+        pos = m.end()# }}}
+
+def tokenize(source):# {{{
+    ''' Scans the whole source at once, and returns the list of its Tokens
+    '''
+    return list(iter_tokens(source))# }}}
 
 # errors {{{
 class UnexpectedTokenException(Exception):
@@ -148,11 +158,15 @@ class ParsingException(Exception):
     pass# }}}
 
 # fail function{{{
-def fail(message, linenum=None):
-    global linenumber, charnumber
+def fail(message, linenum=None, charnum=None):
+    ''' Raises a ParsingException at linenum:charnum. Runtime errors only know their line, and errors in
+        builtins neither.
+    '''
     sys.tracebacklimit = None
-    if linenum is not None:
-        header = f"\n\nError at line {linenum}:{charnumber}\n"
+    if linenum is None:
+        header = "\n\nError\n"
+    elif charnum is None:
+        header = f"\n\nError at line {linenum}\n"
     else:
-        header = f"\n\nError at line {linenumber}:{charnumber}\n"
+        header = f"\n\nError at line {linenum}:{charnum}\n"
     raise ParsingException(header + message)# }}}
@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+''' Hash maps behind the map.* builtins, so a lookup is one call instead of a chain of if/else over
+    integer.equal
+'''
+from array import array
+from lexer import fail
+
+
+COMPACT_SIZE = 65536                # entries from which an all integer map moves to an IntTable
+INT_MIN = -2 ** 63
+INT_MAX = 2 ** 63 - 1
+FIBONACCI = 11400714819323198485    # 2**64 / golden ratio, spreads consecutive keys over the table
+MASK_64 = 2 ** 64 - 1
+
+
+class IntTable:# {{{
+    ''' Open addressing hash table of 64 bit int keys and values, kept in arrays rather than a dict of int
+        objects, in about a third of the memory. Slots are found by Fibonacci hashing and linear probing,
+        and the table doubles when it's two thirds full. Nothing is ever removed, so there are no tombstones.
+    '''
+    __slots__ = ('keys', 'values', 'used', 'size', 'bits')
+
+    def __init__(self, bits=3):
+        capacity = 1 << bits
+        self.keys = array('q', bytes(8 * capacity))
+        self.values = array('q', bytes(8 * capacity))
+        self.used = bytearray(capacity)
+        self.size = 0
+        self.bits = bits
+
+    def find(self, key):
+        ''' Returns the slot holding key, or the empty slot where it would go
+        '''
+        keys = self.keys
+        used = self.used
+        mask = len(used) - 1
+        slot = ((key * FIBONACCI) & MASK_64) >> (64 - self.bits)
+        while used[slot] and keys[slot] != key:
+            slot = (slot + 1) & mask
+        return slot
+
+    def get(self, key, default):
+        keys = self.keys
+        used = self.used
+        mask = len(used) - 1
+        slot = ((key * FIBONACCI) & MASK_64) >> (64 - self.bits) # find(), inlined since lookups are most calls
+        while used[slot]:
+            if keys[slot] == key:
+                return self.values[slot]
+            slot = (slot + 1) & mask
+        return default
+
+    def put(self, key, value):
+        slot = self.find(key)
+        if not self.used[slot]:
+            if 3 * (self.size + 1) > 2 * len(self.used):
+                self.grow()
+                slot = self.find(key)
+            self.used[slot] = 1
+            self.keys[slot] = key
+            self.size += 1
+        self.values[slot] = value
+
+    def grow(self):
+        old = self.items()
+        self.__init__(self.bits + 1)
+        self.fill(old)
+
+    def fill(self, items):
+        for key, value in items:
+            slot = self.find(key)
+            self.used[slot] = 1
+            self.keys[slot] = key
+            self.values[slot] = value
+        self.size += len(items)
+
+    @classmethod
+    def of(cls, items):
+        ''' Returns a table of the list of (key, value) items, with room to grow
+        '''
+        table = cls(max(3, (2 * len(items)).bit_length()))
+        table.fill(items)
+        return table
+
+    def items(self):
+        return [(k, v) for k, v, u in zip(self.keys, self.values, self.used) if u]# }}}
+
+class Map:# {{{
+    ''' A map from integers or strings to any value, passed by reference like a vector: map.put changes it
+        in place, and everything holding it sees the change. Entries are kept in a dict, which is the fastest,
+        until there are COMPACT_SIZE of them. If every key and value is then an integer which fits in 64 bits,
+        they move to an IntTable, and back to a dict when anything else is put in.
+    '''
+    __slots__ = ('table', 'next_compaction')
+    __hash__ = None # changes in place, so it can't be a memoization key
+
+    def __init__(self):
+        self.table = {}
+        self.next_compaction = COMPACT_SIZE
+
+    def __len__(self):
+        return len(self.table) if type(self.table) is dict else self.table.size
+
+    def __str__(self):
+        return '{' + ', '.join(f'{k}: {v}' for k, v in self.table.items()) + '}'
+
+    def __repr__(self):
+        return f'Map({self})'
+
+    def get(self, key, default):
+        table = self.table
+        if type(table) is dict:
+            return table.get(key, default)
+        if not fits(key):
+            return default # anything else was never put in it
+        return table.get(key, default)
+
+    def put(self, key, value):
+        table = self.table
+        if type(table) is dict:
+            table[key] = value
+            if len(table) >= self.next_compaction:
+                self.compact()
+        elif fits(key) and fits_value(value):
+            table.put(key, value)
+        else:
+            self.table = dict(table.items())
+            self.table[key] = value
+            self.next_compaction = 2 * len(self.table)
+
+    def compact(self):
+        items = list(self.table.items())
+        if all(fits(k) and fits_value(v) for k, v in items):
+            self.table = IntTable.of(items)
+        else:
+            self.next_compaction *= 2 # try again when it's twice the size# }}}
+
+def fits(value):# {{{
+    return isinstance(value, int) and INT_MIN <= value <= INT_MAX# }}}
+
+def fits_value(value):# {{{
+    return type(value) is not bool and fits(value) # a bool would come back out of the table as an int# }}}
+
+def as_map(value, name):# {{{
+    if not isinstance(value, Map):
+        fail(f'{name} expected a map, but got {value!r}')
+    return value# }}}
+
+def check_key(key, name):# {{{
+    ''' Returns key if it can be one. A bool from integer.equal can't: True and 1 would be the same entry.
+    '''
+    if type(key) is bool or not isinstance(key, (int, str)):
+        fail(f'{name} expected an integer or string key, but got {key!r}')
+    return key# }}}
+
+
+##### builtins #####
+#==================#
+
+MISSING = object()
+
+def new():
+    return Map()
+
+def size(_map):
+    return len(as_map(_map, 'map.size'))
+
+def has(_map, _key):
+    return as_map(_map, 'map.has').get(check_key(_key, 'map.has'), MISSING) is not MISSING
+
+def get(_map, _key):
+    value = as_map(_map, 'map.get').get(check_key(_key, 'map.get'), MISSING)
+    if value is MISSING:
+        fail(f'Key {_key!r} not in map')
+    return value
+
+def put(_map, _key, _value):
+    as_map(_map, 'map.put').put(check_key(_key, 'map.put'), _value)
+    return _map
@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+''' Modules imported with an imports section: finding each module's file on the search path, parsing it
+    once per program (or loading it from the cache), and linking the functions it exports into the importer's
+    table
+'''
+import os
+from lexer import fail
+import parser
+
+
+MODULE_SUFFIX = '.main'
+DEFAULT_MODULE_PATH = [d for d in os.environ.get('PLEASANT_PATH', '').split(os.pathsep) if d]
+
+
+class Module:# {{{
+    ''' A loaded module. Its function table holds its own functions, under its name as prefix, and those
+        exported by the modules it imports.
+    '''
+    def __init__(self, name, filename, exports, functions):
+        self.name = name
+        self.filename = filename
+        self.exports = set(exports) # qualified names of the exported functions
+        self.functions = functions# }}}
+
+class ModuleLoader:# {{{
+    ''' Loads the modules imported by one program. Each module is parsed once, however many of the program's
+        sources import it, and its functions are linked into every importer's table as they are, so they're
+        the same Function objects (compiled once) everywhere.
+
+        A module is looked for as NAME.main in the directory of the source importing it, then in each
+        directory of search_path.
+    '''
+    def __init__(self, search_path=None, cache_dir=None, lazy=False):
+        self.search_path = DEFAULT_MODULE_PATH if search_path is None else list(search_path)
+        self.cache_dir = cache_dir
+        self.lazy = lazy # parse function bodies on their first call, see parser.LazyBody
+        self.modules = {}   # name -> Module
+        self.loading = []   # names of the modules being loaded, innermost last, to catch import cycles
+
+    def read(self, source, filename, functions, statements):
+        ''' Parses source into the function table and statements, or loads them from the cache, then links
+            in the modules it imports. Returns its header (see parser.Parser.header). A lazily parsed source
+            isn't stored in the cache, that would take parsing all of it.
+        '''
+        use_cache = self.cache_dir is not None and filename is not None
+        header = None
+        if use_cache:
+            import cache
+            header = cache.load(self.cache_dir, filename, source, functions, statements)
+        if header is None:
+            p = parser.Parser(source, functions, statements, self.lazy)
+            p.parse()
+            header = p.header()
+            if use_cache and not self.lazy:
+                cache.store(self.cache_dir, filename, source, functions, statements, header)
+        self.link(header, filename, functions)
+        self.check_calls(header, parser.called_names(statements), functions)
+        return header
+
+    def link(self, header, filename, functions):
+        ''' Loads every module the source with header imports, adds the functions they export to its table,
+            and checks that its own functions only call those
+        '''
+        module_name, imports, _ = header
+        directory = os.path.dirname(os.path.abspath(filename)) if filename is not None else os.getcwd()
+        own = [f for f in functions.values() if isinstance(f, parser.Function) and f.is_defined()]
+        for name in imports:
+            module = self.load(name, directory)
+            for qualified in module.exports:
+                func = module.functions.get(qualified, None)
+                if isinstance(func, parser.Function):
+                    functions.setdefault(qualified, func)
+        for func in own:
+            self.check_calls(header, func.callees(), functions)
+
+    def add_loaded(self, functions):
+        ''' Adds every function of every loaded module to the program's table. The compiled calls of a module's
+            functions are looked up there, whichever module they're in, while check_calls keeps each source
+            to the functions of the modules it imports.
+        '''
+        for module in self.modules.values():
+            for qualified, func in module.functions.items():
+                if isinstance(func, parser.Function):
+                    functions.setdefault(qualified, func)
+
+    def check_calls(self, header, names, functions):
+        ''' Fails if any of names is a function of a module the source with header doesn't import, or one
+            that module doesn't export. The program's table has every loaded module's functions, so nothing
+            else would stop the call.
+        '''
+        module_name, imports, _ = header
+        for name in names:
+            prefix = name.rpartition('.')[0]
+            if prefix == module_name or isinstance(functions.get(name, None), parser.PythonFunction):
+                continue
+            if prefix in imports:
+                if name not in self.modules[prefix].exports:
+                    fail(f"Function '{name}' isn't exported by module {prefix}")
+            elif prefix in self.modules:
+                fail(f"Function '{name}' is in module {prefix}, which {module_name} doesn't import")
+
+    def load(self, name, directory):
+        ''' Returns the Module name, parsing it if it hasn't been yet
+        '''
+        module = self.modules.get(name, None)
+        if module is not None:
+            return module
+        if name in self.loading:
+            fail(f"Modules import each other: {' -> '.join(self.loading + [name])}")
+        filename = self.find(name, directory)
+        functions = parser.builtin_functions()
+        self.loading.append(name)
+        try:
+            module_name, _, exports = self.read(parser.read_file(filename), filename, functions, [])
+        finally:
+            self.loading.pop()
+        if module_name != name:
+            fail(f"{filename} is module '{module_name}', not '{name}'")
+        module = self.modules[name] = Module(name, filename, exports, functions)
+        return module
+
+    def find(self, name, directory):
+        directories = [directory] + self.search_path
+        for d in directories:
+            filename = os.path.join(d, name + MODULE_SUFFIX)
+            if os.path.isfile(filename):
+                return filename
+        fail(f"Module '{name}' not found in {', '.join(directories)}")# }}}
@@ -0,0 +1,232 @@
+#!/usr/bin/python3
+''' Optimization pass over the parsed statement lists: folds pure builtin calls with constant arguments,
+    propagates constants through var declarations which are never reassigned, and drops if/while
+    branches which can never run.
+'''
+import parser
+
+
+class Binding:# {{{
+    ''' One declared variable. constant holds its value once the declaration is folded, unless the
+        variable is ever assigned again.
+    '''
+    def __init__(self, declared_once):
+        self.reassigned = not declared_once
+        self.constant = None
+        self.is_constant = False# }}}
+
+
+class Optimizer:# {{{
+    ''' Runs in two walks over a body, both following the same block scoping as the resolver. The first
+        binds every variable use to its declaration and notes reassignments, the second folds.
+    '''
+    def __init__(self, known_functions):
+        self.known_functions = known_functions
+        self.bindings = {} # id of a variable Expression -> its Binding, in the body being optimized
+        self.declared = {} # id of a parser.VariableDeclaration -> its Binding, if it declares a single name
+        self.blocks = []
+        self.folded = 0
+
+    def optimize_body(self, statements, params=()):
+        # the ids are only those of nodes alive now: a lazy body is optimized long after the others, once
+        # their nodes may be gone and their ids reused by its own
+        self.bindings = {}
+        self.declared = {}
+        self.blocks = [{name: Binding(False) for name in params}]
+        self.bind_block(statements, new_block=False)
+        return self.fold_block(statements)
+
+    ##### binding #####
+
+    def lookup(self, name):
+        for block in reversed(self.blocks):
+            if name in block:
+                return block[name]
+        return None
+
+    def bind_block(self, statements, new_block=True):
+        if new_block:
+            self.blocks.append({})
+        for s in statements:
+            if isinstance(s, list):
+                self.bind_block(s)
+            elif isinstance(s, parser.VariableDeclaration):
+                self.bind_expression(s.expr)
+                for n in s.names:
+                    if n in self.blocks[-1]: # declared again in the same block, which overwrites it
+                        self.blocks[-1][n].reassigned = True
+                    else:
+                        self.blocks[-1][n] = Binding(len(s.names) == 1)
+                if len(s.names) == 1:
+                    self.declared[id(s)] = self.blocks[-1][s.names[0]]
+            elif isinstance(s, parser.AssignStatement):
+                self.bind_expression(s.expr)
+                for n in s.names:
+                    binding = self.lookup(n)
+                    if binding is not None:
+                        binding.reassigned = True
+            elif isinstance(s, parser.WhileStatement):
+                self.bind_expression(s.condition)
+                self.bind_block(s.statements)
+            elif isinstance(s, parser.IfElseStatement):
+                self.bind_expression(s.condition)
+                self.bind_block(s.true_statements)
+                if s.false_statements is not None:
+                    self.bind_block(s.false_statements)
+            elif isinstance(s, parser.FunctionCallStatement):
+                for a in s.args:
+                    self.bind_expression(a)
+        if new_block:
+            self.blocks.pop()
+
+    def bind_expression(self, e):
+        if e.kind == 'variable':
+            binding = self.lookup(e.name)
+            if binding is not None:
+                self.bindings[id(e)] = binding
+        elif e.args:
+            for a in e.args:
+                self.bind_expression(a)
+
+    ##### folding #####
+
+    def fold_block(self, statements):
+        ''' Returns the folded statements. A branch which is always taken stays a block of its own (a
+            nested list), so the variables declared in it stay scoped to it.
+        '''
+        folded = []
+        for s in statements:
+            if isinstance(s, list):
+                folded.append(self.fold_block(s))
+            elif isinstance(s, parser.VariableDeclaration):
+                s.expr = self.fold_expression(s.expr)
+                binding = self.declared.get(id(s), None)
+                if binding is not None and not binding.reassigned and s.expr.kind == 'value' \
+                        and not isinstance(s.expr.value, list):
+                    binding.constant = s.expr.value
+                    binding.is_constant = True
+                folded.append(s)
+            elif isinstance(s, parser.AssignStatement):
+                s.expr = self.fold_expression(s.expr)
+                folded.append(s)
+            elif isinstance(s, parser.WhileStatement):
+                s.condition = self.fold_expression(s.condition)
+                if s.condition.kind == 'value' and not s.condition.value:
+                    self.folded += 1
+                    continue # never runs
+                s.statements = self.fold_block(s.statements)
+                folded.append(s)
+            elif isinstance(s, parser.IfElseStatement):
+                s.condition = self.fold_expression(s.condition)
+                s.true_statements = self.fold_block(s.true_statements)
+                if s.false_statements is not None:
+                    s.false_statements = self.fold_block(s.false_statements)
+                if s.condition.kind == 'value':
+                    self.folded += 1
+                    if s.condition.value:
+                        folded.append(s.true_statements)
+                    elif s.false_statements is not None:
+                        folded.append(s.false_statements)
+                    continue
+                folded.append(s)
+            elif isinstance(s, parser.FunctionCallStatement):
+                s.args = [self.fold_expression(a) for a in s.args]
+                folded.append(s)
+            else:
+                folded.append(s)
+        return folded
+
+    def fold_expression(self, e):
+        if e.kind == 'variable':
+            binding = self.bindings.get(id(e), None)
+            if binding is not None and binding.is_constant:
+                self.folded += 1
+                return parser.Expression('value', binding.constant, None, None, e.linenum)
+            return e
+        if e.kind != 'function' and e.kind != 'operation':
+            return e
+
+        e.args = [self.fold_expression(a) for a in e.args]
+        func = self.known_functions.get(e.name, None)
+        if not isinstance(func, parser.PythonFunction) or not func.pure or len(func.inputs) != len(e.args):
+            return e
+        if any(a.kind != 'value' for a in e.args):
+            return e
+        try:
+            value = func.func(*[a.value for a in e.args])
+        except Exception: # leave it to fail at runtime, where it always did
+            return e
+        self.folded += 1
+        return parser.Expression('value', value, None, None, e.linenum)# }}}
+
+
+def optimize_program(functions, statements):# {{{
+    ''' Optimizes every defined function body of the function table and the program section statements in
+        place, and returns how many expressions and branches were folded. A lazy body is optimized once it's
+        parsed, and isn't counted.
+    '''
+    optimizer = Optimizer(functions)
+    for func in list(functions.values()):
+        if isinstance(func, parser.Function) and func.is_defined():
+            params = list(func.inputs.keys()) + list(func.outputs.keys())
+            if func.lazy_body is not None:
+                func.lazy_body.transforms.append(lambda body, params=params: optimizer.optimize_body(body, params))
+            else:
+                func.set_statements(optimizer.optimize_body(func.statements, params))
+    statements[:] = optimizer.optimize_body(statements)
+    return optimizer.folded# }}}
+
+
+##### dumping #####
+#=================#
+
+def format_expression(e):# {{{
+    if e.kind == 'value':
+        if isinstance(e.value, str):
+            return f'"{e.value}"'
+        return repr(e.value)
+    if e.kind == 'variable':
+        return e.name
+    return f"{e.name}({', '.join(format_expression(a) for a in e.args)})"# }}}
+
+def format_names(names):# {{{
+    if len(names) == 1:
+        return names[0]
+    return f"({', '.join(names)})"# }}}
+
+def format_block(statements, indent='  '):# {{{
+    ''' Returns the lines of statements, written out like Pleasant source
+    '''
+    lines = []
+    for s in statements:
+        if isinstance(s, list):
+            lines.append(indent + '{')
+            lines += format_block(s, indent + '  ')
+            lines.append(indent + '}')
+        elif isinstance(s, parser.VariableDeclaration):
+            lines.append(f'{indent}var {format_names(s.names)} = {format_expression(s.expr)};')
+        elif isinstance(s, parser.AssignStatement):
+            lines.append(f'{indent}{format_names(s.names)} = {format_expression(s.expr)};')
+        elif isinstance(s, parser.WhileStatement):
+            lines.append(f'{indent}while({format_expression(s.condition)})')
+            lines += [indent + '{'] + format_block(s.statements, indent + '  ') + [indent + '}']
+        elif isinstance(s, parser.IfElseStatement):
+            lines.append(f'{indent}if({format_expression(s.condition)})')
+            lines += [indent + '{'] + format_block(s.true_statements, indent + '  ') + [indent + '}']
+            if s.false_statements is not None:
+                lines.append(indent + 'else')
+                lines += [indent + '{'] + format_block(s.false_statements, indent + '  ') + [indent + '}']
+        elif isinstance(s, parser.FunctionCallStatement):
+            lines.append(f"{indent}{s.name}({', '.join(format_expression(a) for a in s.args)});")
+    return lines# }}}
+
+def dump_program(functions, statements):# {{{
+    ''' Returns the program section and every defined function, written out like Pleasant source
+    '''
+    lines = ['program', '{'] + format_block(statements) + ['}', '', 'functions', '{']
+    for func in functions.values():
+        if isinstance(func, parser.Function) and func.is_defined():
+            lines.append(f"  ({', '.join(func.outputs.keys())}) = {func.name}({', '.join(func.inputs.keys())})")
+            lines += ['  {'] + format_block(func.statements, '    ') + ['  }']
+    lines.append('}')
+    return '\n'.join(lines)# }}}
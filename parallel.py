@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+''' parallel.map, which calls a pure function over a range of integers on a pool of worker processes, so an
+    embarrassingly parallel loop runs on every core instead of one.
+
+    parallel.map(name, start, end) returns a vector of name(i) for every i from start up to end (not included),
+    in order. The function has to be pure (see parser.find_pure_functions), since its calls run in other
+    processes, and nothing they did to a vector or a file would be seen by the program. The pool is started by
+    the program's first parallel.map: each worker gets every pure function with one output, and everything they
+    call, once, encoded like the cache encodes a parsed program, and compiles each on its first call. Every later
+    map, of whichever function, only sends the worker the function's name and a chunk of the range.
+'''
+import os
+import sys
+from itertools import repeat
+from lexer import fail
+import parser
+import cache
+import tasks
+import vectors
+
+
+WORKERS = os.cpu_count() or 1
+CHUNKS_PER_WORKER = 4   # chunks the range is split into per worker, so a slow chunk doesn't hold up the rest
+
+
+##### workers #####
+#=================#
+
+worker_functions = None # in each worker: the function table decoded from the program
+
+def start_worker(encoded, memo_size, digits):# {{{
+    ''' Decodes the program's functions into a table of the worker's own, each compiled on its first call.
+        Integers are limited to the digits the program's process allows.
+    '''
+    global worker_functions
+    parser.allow_long_integers(digits)
+    functions = parser.builtin_functions()
+    cache.decode_program(encoded, functions, [])
+    parser.memoize_pure_functions(functions, memo_size)
+    for func in functions.values():
+        if isinstance(func, parser.Function) and func.is_defined():
+            func.compile_lazily(functions)
+    worker_functions = functions# }}}
+
+def run_chunk(name, start, end):# {{{
+    ''' Returns the results of name(i) for i in the chunk, computed on a deep stack like a program's calls
+    '''
+    call = worker_functions[name].call
+    results = []
+    def body(frame):
+        for i in range(start, end):
+            results.append(call(i))
+    parser.run_with_deep_stack(body, [], worker_functions)
+    return results# }}}
+
+
+##### pool #####
+#==============#
+
+def shipped(functions):# {{{
+    ''' Returns the table of every function parallel.map could run, pure with one output, and of everything
+        they call in turn
+    '''
+    found = {}
+    pending = [f.name for f in functions.values()
+               if isinstance(f, parser.Function) and f.is_defined() and f.pure and len(f.outputs) == 1]
+    while pending:
+        func = functions.get(pending.pop(), None)
+        if isinstance(func, parser.Function) and func.is_defined() and func.name not in found:
+            found[func.name] = func
+            pending.extend(func.callees())
+    return found# }}}
+
+def workers(program, func):# {{{
+    ''' Returns the pool of the running program, starting it on its first map. The workers get every function
+        a map could run, so maps of different functions all share the one pool.
+    '''
+    if program.pool is not None:
+        return program.pool
+    from concurrent.futures import ProcessPoolExecutor # only programs with a pool pay for importing it
+    encoded = cache.encode_program(shipped(program.functions), [], ('main', [], []))
+    memo_size = func.cache.maxsize if func.cache is not None else 0 # as the program memoizes
+    digits = sys.get_int_max_str_digits() if hasattr(sys, 'get_int_max_str_digits') else 0
+    program.pool = ProcessPoolExecutor(max_workers=WORKERS, initializer=start_worker,
+                                       initargs=(encoded, memo_size, digits))
+    program.cleanups.append(program.pool.shutdown)
+    return program.pool# }}}
+
+def chunks(start, end, count):# {{{
+    ''' Splits the range from start to end into at most count chunks of about the same size
+    '''
+    size = max(1, -(-(end - start) // count))
+    return [(i, min(i + size, end)) for i in range(start, end, size)]# }}}
+
+
+##### builtins #####
+#==================#
+
+def map_range(_fname, _start, _end):
+    program = tasks.running('parallel.map')
+    func = program.find(_fname, 1, 'parallel.map')
+    if not isinstance(_start, int) or not isinstance(_end, int):
+        fail(f'parallel.map expected a range of integers, but got {_start!r} to {_end!r}')
+    if isinstance(func, parser.PythonFunction):
+        fail(f'parallel.map runs functions of the program, not builtins like {func.name}')
+    if not func.pure:
+        fail(f"parallel.map: {func.name} isn't pure (it, or something it calls, has side effects)")
+    if len(func.outputs) != 1:
+        fail(f'parallel.map: {func.name} has to return one integer, not {len(func.outputs)} values')
+    if _end <= _start:
+        return vectors.Vector.of([])
+    if WORKERS == 1: # a pool would only add shipping the calls to it
+        results = [program.call(func.name, (i,)) for i in range(_start, _end)]
+    else:
+        starts, ends = zip(*chunks(_start, _end, CHUNKS_PER_WORKER * WORKERS))
+        results = []
+        for chunk in workers(program, func).map(run_chunk, repeat(func.name), starts, ends):
+            results.extend(chunk)
+    if not all(isinstance(r, int) for r in results):
+        fail(f'parallel.map: {func.name} has to return integers')
+    return vectors.Vector.of(results)
@@ -1,114 +1,558 @@
 #!/usr/bin/python3
 from lexer import *
-import lexer as lex
 import sys
 import os
+import math
+import mmap
+import threading
+from collections import OrderedDict
+import buffers
+import vectors
+import maps
+import strings
+import tasks
+import parallel
 sys.tracebacklimit = None
 
 IDENTIFIER = '[a-zA-Z][a-zA-Z0-9_.]*'
 NUMBER = '([0-9]+)|(-[0-9]+)'
 STRING_LITERAL = '".*'
+KEYWORDS = {'var', 'if', 'else', 'while'}
 
-# global avl                  # nested dictionary of variables: {scope: {var: val, var2: val2}, ... }
-global known_functions      # dictionary of Function objects 
-global scope_num            # int which keeps track of scope
-global current_module_name  # module name to prepend to functions
-global statement_queue      # list of statements to execute, in order
-global active_params
-global function_depth
-global scope
-global tokenizer
-
-function_depth = 0
-known_functions = {}
-scope_num = 0
-current_module_name = 'main'
-statement_queue = []
-active_params = {function_depth: {}}
-scope = {function_depth: {scope_num: {}}}
-
-
-def parse(filename):# {{{
-    global tokenizer
-    text = open(filename, 'r').read()
-    tokenizer = Tokenizer(text)
-    initialize_known_functions()
-    main_module_exports()
-    for s in statement_queue:
-        s.handle()# }}}
-
-##### utilities #####
-#===================#
-
-def increase_scope():# {{{
-    global scope 
-    global scope_num
-    global function_depth
-    scope_num += 1
-    scope[function_depth][scope_num] = {}
-    # }}}
+VERSION = '1.2'             # bump whenever the parsed tree changes, so cached programs are parsed again
+DEFAULT_MEMO_SIZE = 1024    # results kept per pure function, 0 turns memoization off
+RECURSION_LIMIT = 200000    # Python frames available to the compiled closures, each call takes a few
+STACK_SIZE = 1024 ** 3      # bytes of stack for the thread running the compiled closures
+# what a program whose calls nest too deep fails with, on either backend
+RECURSION_MESSAGE = 'Maximum recursion depth exceeded (self tail calls run in constant space)'
+RECURSION_ERROR = '\n\nError\n' + RECURSION_MESSAGE # as lexer.fail words it, for the closures' RecursionError
 
-def decrease_scope():# {{{
-    global scope 
-    global scope_num
-    global function_depth
-    scope[function_depth].pop(scope_num)
-    scope_num -= 1
-    # }}}
 
-def increase_depth():# {{{
-    global function_depth
-    global scope
-    global scope_num
-    function_depth += 1
-    scope_num = 0
-    scope[function_depth] = {scope_num: {}}
-    active_params[function_depth] = {}
-    # }}}
+class Interpreter:# {{{
+    ''' Owns everything a program needs: its function table (builtins included), the statements of its
+        program section, and the options it runs with. Instances share no state, so any number of programs
+        can be loaded and run in one process, one after another or side by side.
 
-def decrease_depth():# {{{
-    global function_depth
-    global scope
-    global scope_num
-    scope.pop(function_depth)
-    active_params.pop(function_depth)
-    function_depth -= 1
-    scope_num = max(scope[function_depth].keys())
-    # }}}
+        interp = Interpreter(use_vm=True)
+        interp.load(source)
+        interp.run()
+
+        With stream set, load() parses the functions but only finds the program section, and run() parses
+        it again a statement at a time, running each one as soon as it's parsed. The program section is never
+        held in memory whole, and isn't optimized or cached.
+
+        With lazy set, function bodies are only skimmed by load(), and each is parsed on the function's first
+        call (see LazyBody), so a run only parses the functions it uses.
+    '''
+    def __init__(self, use_vm=False, memo_size=DEFAULT_MEMO_SIZE, optimize=True, cache_dir=None, profile=False,
+                 stream=False, module_path=None, lazy=False):
+        if use_vm and profile:
+            fail('Profiling works on the compiled closures, not on the VM')
+        self.use_vm = use_vm
+        self.memo_size = memo_size
+        self.optimize = optimize
+        self.cache_dir = cache_dir
+        self.profile = profile
+        self.stream = stream
+        self.module_path = module_path # directories imported modules are looked for in, see modules.py
+        self.lazy = lazy
+        self.profiler = None  # the profiler.Profiler of the last compile, if profiling
+        self.functions = {}   # name -> Function or PythonFunction
+        self.statements = []  # statements of the program section, in order
+        self.folded = 0       # expressions and branches folded by the optimizer
+        self.program = None   # closure running the compiled program, once compiled
+        self.modules = None   # modules.ModuleLoader of the imported modules
+        self.header = None    # of the main source, see Parser.header
+        self.source = None    # when streaming, the source and the Token the program section starts at
+        self.stream_start = None
+
+    def load(self, source, filename=None):
+        ''' Parses (and optimizes) the program in source, replacing whatever was loaded before, and links in
+            the modules it imports. With a cache_dir and a filename, the parsed program and modules are loaded
+            from the cache when their source hasn't changed, and stored there when it has.
+        '''
+        import modules
+        self.functions = builtin_functions()
+        self.statements = []
+        self.folded = 0
+        self.program = None
+        self.source = self.header = self.stream_start = None
+        self.modules = modules.ModuleLoader(self.module_path, self.cache_dir, self.lazy)
+        if self.stream:
+            p = Parser(source, self.functions, self.statements, self.lazy)
+            self.stream_start = p.skim()
+            self.header = p.header()
+            self.modules.link(self.header, filename, self.functions)
+            if self.stream_start is not None:
+                self.source = source
+        else:
+            self.header = self.modules.read(source, filename, self.functions, self.statements)
+        self.modules.add_loaded(self.functions)
+        if self.optimize:
+            import optimizer
+            self.folded = optimizer.optimize_program(self.functions, self.statements)
+        return self
+
+    def load_file(self, filename):
+        ''' Loads filename through a memory mapping, so the source is only read (and decoded) a token at a time
+        '''
+        return self.load(read_file(filename), filename)
+
+    def stream_statements(self):
+        ''' Returns an iterator parsing the statements of the program section as they're asked for
+        '''
+        statements = Parser(self.source, self.functions, []).program_statements(self.stream_start)
+        statements = self.checked_statements(statements)
+        if self.profiler is not None:
+            statements = self.profiler.instrument_stream(statements)
+        return statements
+
+    def checked_statements(self, statements):
+        for s in statements:
+            self.check_calls(called_names([s]))
+            yield s
+
+    def check_calls(self, names):
+        ''' Fails if the program calls any of names without importing it, see modules.ModuleLoader.check_calls
+        '''
+        self.modules.check_calls(self.header, names, self.functions)
+
+    def dump(self):
+        ''' Returns the loaded (and optimized) program, written out like Pleasant source
+        '''
+        import optimizer
+        return optimizer.dump_program(self.functions, self.statements)
+
+    def compile(self):
+        memoize_pure_functions(self.functions, self.memo_size)
+        if self.profile:
+            import profiler
+            self.profiler = profiler.Profiler()
+            self.profiler.instrument(self.functions, self.statements)
+        if self.use_vm:
+            import vm
+            if self.source is not None:
+                self.program = vm.compile_stream(self.functions, self.stream_statements, self.check_calls)
+            else:
+                self.program = vm.compile_program(self.functions, self.statements, self.check_calls)
+        elif self.source is not None:
+            self.program = compile_stream(self.functions, self.stream_statements, self.check_calls)
+        else:
+            self.program = compile_program(self.functions, self.statements, self.check_calls)
+
+    def run(self):
+        ''' Runs the loaded program, compiling it first if it hasn't been. Running it again keeps the memoized
+            results of the previous runs.
+        '''
+        if self.program is None:
+            self.compile()
+        if self.profiler is not None:
+            self.profiler.start()
+        try:
+            self.program()
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+            buffers.output.flush_all() # whether the program finished or failed
+
+    def memo_stats(self):
+        return memo_stats(self.functions)# }}}
+
+def parse(filename, use_vm=False, memo_size=DEFAULT_MEMO_SIZE, optimize=True, dump_tree=False, cache_dir=None):# {{{
+    ''' Parses and runs filename on a new Interpreter, either with the compiled closures or, if use_vm is set,
+        on the bytecode VM. With dump_tree set, prints the (optimized) statements instead of running them.
+        Returns the Interpreter.
+    '''
+    interp = Interpreter(use_vm, memo_size, optimize, cache_dir)
+    interp.load_file(filename)
+    if dump_tree:
+        print(f'# {interp.folded} expressions and branches folded')
+        print(interp.dump())
+    else:
+        interp.run()
+    return interp# }}}
+
+def read_file(filename):# {{{
+    ''' Returns a read only memory mapping of filename, which can be parsed without reading it whole
+    '''
+    with open(filename, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # an empty file can't be mapped
+            return b''# }}}
+
+##### compiler #####
+#==================#
+
+def compile_program(functions, statements, check_calls=None):# {{{
+    ''' Compiles the program section into closures, and returns the closure which runs the program. Each
+        defined function is compiled on its first call. check_calls(names) fails if the program can't call
+        the functions names, as task.spawn or parallel.map would.
+    '''
+    for func in list(functions.values()):
+        if isinstance(func, Function) and func.is_defined():
+            func.compile_lazily(functions)
+
+    scope = Scope()
+    resolve_block(statements, scope, new_block=False)
+    body = compile_block(statements, functions)
+    frame_size = scope.size
+
+    def run_program():
+        run_with_deep_stack(body, [None] * frame_size, functions, check_calls)
+    return run_program# }}}
+
+def compile_stream(functions, statements, check_calls=None):# {{{
+    ''' Like compile_program, but statements is a function returning an iterator over the program section.
+        Each statement it yields is resolved, compiled and run before the next one is asked for, in a frame
+        which grows as they declare variables.
+    '''
+    for func in list(functions.values()):
+        if isinstance(func, Function) and func.is_defined():
+            func.compile_lazily(functions)
+
+    def run_statements(frame):
+        scope = Scope()
+        for s in statements():
+            resolve_block([s], scope, new_block=False)
+            if len(frame) < scope.size:
+                frame.extend([None] * (scope.size - len(frame)))
+            compile_block([s], functions)(frame)
+
+    def run_program():
+        run_with_deep_stack(run_statements, [], functions, check_calls)
+    return run_program# }}}
+
+# the recursion limit and thread stack size are per process, so programs running side by side share them
+stack_lock = threading.Lock()
+deep_runs = 0           # programs running on a deep stack, the recursion limit is restored when none is
+saved_limit = None      # recursion limit from before the first of them started
+
+def run_with_deep_stack(body, frame, functions, check_calls=None):# {{{
+    ''' Runs body(frame) on a thread with a large stack, since the closures of each call recurse on the
+        Python stack, as a program whose tasks call into functions. Whatever body raises is raised again here.
+    '''
+    global deep_runs, saved_limit
+    errors = []
+    def target():
+        try:
+            with tasks.program(functions, function_caller(functions), check_calls):
+                body(frame)
+        except RecursionError:
+            errors.append(ParsingException(RECURSION_ERROR))
+        except BaseException as e:
+            errors.append(e)
+
+    with stack_lock:
+        if deep_runs == 0:
+            saved_limit = sys.getrecursionlimit()
+            sys.setrecursionlimit(max(saved_limit, RECURSION_LIMIT))
+        deep_runs += 1
+    try:
+        start_thread(target).join()
+    finally:
+        with stack_lock:
+            deep_runs -= 1
+            if deep_runs == 0:
+                sys.setrecursionlimit(saved_limit)
+    if errors:
+        raise errors[0]# }}}
+
+def allow_long_integers(digits=0):# {{{
+    ''' Lets integers of up to digits digits (any, for 0) be written and read back whole. CPython refuses to
+        convert longer ones to or from text, against denial of service, and the limit holds for the whole
+        process, so only the interpreter script and its worker processes lift it: a program embedding an
+        Interpreter keeps whatever limit it set.
+    '''
+    if hasattr(sys, 'set_int_max_str_digits'):
+        sys.set_int_max_str_digits(digits)# }}}
+
+def start_thread(target):# {{{
+    ''' Starts a daemon thread running target() with a stack of STACK_SIZE, and returns it
+    '''
+    with stack_lock: # the stack size applies to every thread started while it's set
+        old_size = threading.stack_size(STACK_SIZE)
+        try:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+        finally:
+            threading.stack_size(old_size)
+    return thread# }}}
+
+def function_caller(functions):# {{{
+    ''' Returns how a task spawned by the program calls a function of its table, see tasks.py
+    '''
+    def call(name, args):
+        return tasks.find_function(functions, name, len(args)).call(*args)
+    return call# }}}
 
-def get_var(name):# {{{
-    global active_params
-    global scope
-    global scope_num
-    global function_depth
-    if name in active_params[function_depth]:
-        return active_params[function_depth][name]
-    for num in range(scope_num, -1, -1):
-        if name in scope[function_depth][num]:
-            return scope[function_depth][num][name]
-    fail(f'Variable {name} not found in active parameters or current scope')# }}}
-
-def is_var_defined(name):# {{{
-    global active_params
-    global scope
-    global scope_num
-    global function_depth
-    if name in active_params[function_depth]:
-        return (function_depth, None)
-    for num in range(scope_num, -1, -1):
-        if name in scope[function_depth][num]:
-            return (function_depth, num) 
-    return None, None# }}}
-
-def set_var(name, value, depth, num=None):# {{{
-    # global function_depth
-    global active_params
-    global scope
-    # global scope_num
-    if num is None:
-        active_params[depth][name] = value
+def compile_block(statements, functions):# {{{
+    ''' Compiles a list of statements into a single closure which runs them in order, calling into the
+        function table functions
+    '''
+    steps = tuple(compile_block(s, functions) if isinstance(s, list) else s.compile(functions) for s in statements)
+    if len(steps) == 0:
+        def run_block(frame):
+            pass
+    elif len(steps) == 1:
+        run_block = steps[0]
+    elif len(steps) == 2:
+        first, second = steps
+        def run_block(frame):
+            first(frame)
+            second(frame)
+    else:
+        def run_block(frame):
+            for step in steps:
+                step(frame)
+    return run_block# }}}
+
+def compile_tail_block(statements, func, functions):# {{{
+    ''' Compiles the body of func. The closure returns True only when a self tail call in the last statement
+        has put its arguments in the frame, and the body has to run again. Otherwise it returns None.
+    '''
+    if not statements:
+        return compile_block(statements, functions)
+    *rest, last = statements
+    if isinstance(last, list):
+        last_step = compile_tail_block(last, func, functions)
+    elif isinstance(last, IfElseStatement):
+        last_step = last.compile(functions, tail_of=func)
+    elif isinstance(last, AssignStatement) and last.is_tail_call(func):
+        last_step = last.compile_tail_call(func, functions)
+    else:
+        step = compile_block([last], functions)
+        def last_step(frame):
+            step(frame) # a call statement returns the value of its call, which is dropped here
+
+    if not rest:
+        return last_step
+    body = compile_block(rest, functions)
+    def run_tail_block(frame):
+        body(frame)
+        return last_step(frame)
+    return run_tail_block# }}}
+
+def compile_failure(message, linenum=None):# {{{
+    ''' Returns a closure which fails with message when it runs, so errors keep happening at runtime
+    '''
+    def failing(*_):
+        fail(message, linenum)
+    return failing# }}}
+
+def compile_call(functions, name, args, linenum):# {{{
+    ''' Binds the callee and compiled arguments of a function call, and returns a closure which calls it
+    '''
+    func = functions.get(name, None)
+    if func is None:
+        return compile_failure(f"Unknown function '{name}'", linenum)
+    if not func.is_defined():
+        return compile_failure(f"Function '{name}' declared, but undefined", linenum)
+    error = arity_error(func, name, len(args))
+    if error is not None:
+        return compile_failure(error, linenum) # mismatched inputs
+
+    call = func.call
+    compiled = tuple(a.compile(functions) for a in args)
+    if len(compiled) == 0:
+        def run_call(frame):
+            return call()
+    elif len(compiled) == 1:
+        arg0, = compiled
+        def run_call(frame):
+            return call(arg0(frame))
+    elif len(compiled) == 2:
+        arg0, arg1 = compiled
+        def run_call(frame):
+            return call(arg0(frame), arg1(frame))
+    elif len(compiled) == 3:
+        arg0, arg1, arg2 = compiled
+        def run_call(frame):
+            return call(arg0(frame), arg1(frame), arg2(frame))
     else:
-        scope[depth][num][name] = value# }}}
+        def run_call(frame):
+            return call(*[a(frame) for a in compiled])
+    return run_call# }}}
+
+def arity_error(func, name, nargs):# {{{
+    ''' Returns the error of calling func with nargs arguments, or None if it takes that many
+    '''
+    variadic = isinstance(func, PythonFunction) and func.variadic
+    if len(func.inputs) == nargs or (variadic and nargs > len(func.inputs)):
+        return None
+    expected = f'at least {len(func.inputs)}' if variadic else len(func.inputs)
+    return f"Error in call of function {name}: expected {expected} args, but got {nargs}"# }}}
+
+def compile_operation(functions, name, args):# {{{
+    ''' Returns a closure which runs an inlined integer builtin directly on its arguments' values
+    '''
+    compiled = tuple(a.compile(functions) for a in args)
+    if len(compiled) == 1:
+        arg0, = compiled
+        operation = native_operations[name]
+        return lambda frame: operation(arg0(frame))
+
+    a, b = compiled
+    if name == 'integer.add':
+        return lambda frame: a(frame) + b(frame)
+    elif name == 'integer.subtract':
+        return lambda frame: a(frame) - b(frame)
+    elif name == 'integer.multiply':
+        return lambda frame: a(frame) * b(frame)
+    elif name == 'integer.equal':
+        return lambda frame: a(frame) == b(frame)
+    operation = native_operations[name]
+    return lambda frame: operation(a(frame), b(frame))# }}}
+
+##### resolver #####
+#==================#
+
+class Scope:# {{{
+    ''' Maps variable names to frame slots while resolving one function body (or the program section).
+        blocks is a stack of {name: slot} dictionaries, one per statement block. Slots of a block are
+        reused once the block is closed, so size is the most slots that are ever live at once.
+    '''
+    def __init__(self, params=(), in_function=False):
+        self.blocks = [{}]
+        self.marks = []
+        self.next_slot = 0
+        self.size = 0
+        self.in_function = in_function
+        for name in params:
+            if name not in self.blocks[0]: # an output may share its name with an input
+                self.declare(name)
+
+    def lookup(self, name):
+        for block in reversed(self.blocks):
+            if name in block:
+                return block[name]
+        return None
+
+    def declare(self, name):
+        if name in self.blocks[-1]:
+            return self.blocks[-1][name]
+        slot = self.next_slot
+        self.next_slot += 1
+        self.size = max(self.size, self.next_slot)
+        self.blocks[-1][name] = slot
+        return slot
+
+    def push(self):
+        self.blocks.append({})
+        self.marks.append(self.next_slot)
+
+    def pop(self):
+        self.blocks.pop()
+        self.next_slot = self.marks.pop()# }}}
+
+def resolve_block(statements, scope, new_block=True):# {{{
+    ''' Gives a frame slot to every variable used in statements. Blocks (the bodies of if and while) get a
+        scope of their own, so a variable declared inside one isn't visible after it.
+    '''
+    if new_block:
+        scope.push()
+    for s in statements:
+        if isinstance(s, list):
+            resolve_block(s, scope)
+        else:
+            s.resolve(scope)
+    if new_block:
+        scope.pop()# }}}
+
+
+##### memoization #####
+#=====================#
+
+class CallCache:# {{{
+    ''' Bounded least recently used cache of a pure function's results, keyed on its argument values
+    '''
+    def __init__(self, maxsize):
+        self.entries = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def store(self, key, result):
+        self.entries[key] = result
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    @staticmethod
+    def key(values):
+        ''' Returns the key of a call on values. Each value is keyed with its type, since True == 1 and
+            hash(True) == hash(1), but a call on one doesn't return what a call on the other does.
+        '''
+        return tuple((type(v), v) for v in values)# }}}
+
+def called_names(statements):# {{{
+    ''' Returns the names of every function called in statements, including calls nested in arguments
+    '''
+    names = set()
+    expressions = []
+    for s in statements:
+        if isinstance(s, list):
+            names |= called_names(s)
+        elif isinstance(s, WhileStatement):
+            expressions.append(s.condition)
+            names |= called_names(s.statements)
+        elif isinstance(s, IfElseStatement):
+            expressions.append(s.condition)
+            names |= called_names(s.true_statements)
+            names |= called_names(s.false_statements or [])
+        elif isinstance(s, FunctionCallStatement):
+            names.add(s.name)
+            expressions.extend(s.args)
+        else:
+            expressions.append(s.expr)
+    while expressions:
+        e = expressions.pop()
+        if e.kind == 'function':
+            names.add(e.name)
+        if e.args:
+            expressions.extend(e.args)
+    return names# }}}
+
+def find_pure_functions(functions):# {{{
+    ''' Marks each defined Function as pure if everything it calls, transitively, is a pure builtin or a
+        pure Function. Starts by assuming every Function is pure, and removes the ones calling anything
+        else until nothing changes, so recursive functions are handled.
+    '''
+    candidates = {name: f.callees() for name, f in functions.items()
+                  if isinstance(f, Function) and f.is_defined()}
+    changed = True
+    while changed:
+        changed = False
+        for name, callees in list(candidates.items()):
+            for callee in callees:
+                func = functions.get(callee, None)
+                if callee in candidates or (isinstance(func, PythonFunction) and func.pure):
+                    continue
+                candidates.pop(name)
+                changed = True
+                break
+    for name, f in functions.items():
+        if isinstance(f, Function):
+            f.pure = name in candidates# }}}
+
+def memoize_pure_functions(functions, size):# {{{
+    ''' Gives every pure Function a result cache of the given size, or none if size is 0
+    '''
+    find_pure_functions(functions)
+    if size <= 0:
+        return
+    for f in functions.values():
+        if isinstance(f, Function) and f.pure:
+            f.memoize(size)# }}}
+
+def memo_stats(functions):# {{{
+    ''' Returns a line of cache statistics for each memoized function
+    '''
+    lines = []
+    for name, f in functions.items():
+        if isinstance(f, Function) and f.cache is not None:
+            cache = f.cache
+            lines.append(f'{name}: {cache.hits} hits, {cache.misses} misses, {len(cache.entries)} cached')
+    return lines# }}}
 
 
 ##### interpreter #####
@@ -116,132 +560,253 @@ def set_var(name, value, depth, num=None):# {{{
 
 class Expression:# {{{
     def __init__(self, kind, value=None, name=None, args=None, linenum=None):
-        self.kind = kind  # number, string, variable, function
+        self.kind = kind  # value, variable, function, or operation (an inlined integer builtin)
         self.value = value # if number or string, the value of it; else, None
         self.name = name # if number or string, None; else, name associated with the variable or function
         self.args = args
         self.linenum = linenum
-
-    def evaluate(self):
-        global known_functions
-        global scope_num
-        global function_depth
-        global scope
-
+        self.slot = None # if variable, its frame slot once resolved
+
+    def resolve(self, scope):
+        if self.kind == 'variable':
+            self.slot = scope.lookup(self.name)
+        elif self.kind == 'function' or self.kind == 'operation':
+            for a in self.args:
+                a.resolve(scope)
+
+    def compile(self, functions):
+        ''' Returns a closure which computes the value of this expression in a frame
+        '''
         if self.kind == 'value':
-            return self.value
+            value = self.value
+            return lambda frame: value
         elif self.kind == 'variable':
-            var = get_var(self.name)
-            return var.evaluate()
+            slot = self.slot
+            if slot is None:
+                return compile_failure(f'Variable {self.name} not found in active parameters or current scope',
+                        self.linenum)
+            return lambda frame: frame[slot]
         elif self.kind == 'function':
-            if self.name in known_functions:
-                output = known_functions[self.name].call(self.args).evaluate() # args is a list of Expressions
-                return output
-
-            fail(f"Unknown function '{self.name}'", self.linenum)
+            return compile_call(functions, self.name, self.args, self.linenum)
+        elif self.kind == 'operation':
+            return compile_operation(functions, self.name, self.args)
+        fail(f"Unknown expression kind '{self.kind}'", self.linenum)
 # }}}
 
+class LazyBody:# {{{
+    ''' A function body which was only skimmed: where its block starts in the source, and the names of the
+        functions it calls, found while skipping it. It's parsed when the function's statements are first
+        asked for, which is on its first call, by the same Parser code with the same line numbers as always.
+    '''
+    def __init__(self, source, start, module_name, functions, called):
+        self.source = source
+        self.start = start              # Token of the block's '{'
+        self.module_name = module_name
+        self.functions = functions
+        self.called = called
+        self.transforms = []            # run on the statements once parsed, as the optimizer and profiler would have
+
+    def parse(self):
+        p = Parser(self.source, self.functions, [])
+        p.module_name = self.module_name
+        p.tokenizer = Tokenizer(self.source, self.start.offset, self.start.line, self.start.column)
+        statements = p.statement_block()
+        for transform in self.transforms:
+            statements = transform(statements)
+        return statements# }}}
+
 class Function:# {{{
     def __init__(self, name, inputs, outputs, statements):
         self.name = name
         self.outputs = outputs
         self.inputs = inputs
+        self.lazy_body = None # LazyBody, while the body hasn't been parsed
         self.statements = statements # list of statement objects, either assign, while etc.
-        global known_functions
+        self.pure = False  # set by find_pure_functions
+        self.cache = None  # CallCache of results, if the function is pure and memoized
+
+    @property
+    def statements(self):
+        if self.lazy_body is not None:
+            self._statements = self.lazy_body.parse()
+            self.lazy_body = None
+        return self._statements
 
-        if self.name in known_functions:
-            if known_functions[self.name].is_defined(): # we already have a defined function
-                fail(f"Function {self.name} has already been defined.") # redefinition of same function
-            elif not self.is_defined(): # function isn't defined, so are we defining it now?
-                fail(f"Function {self.name} has already been declared.") # no, so we're repeating a declaration
-            else: # we are providing a definition
-                known_functions[self.name] = self
+    @statements.setter
+    def statements(self, stmts):
+        self._statements = stmts
 
     def set_statements(self, stmts):
         self.statements = stmts
 
-    def is_defined(self):
-        return self.statements is not None
-
-    def call(self, arguments): # arguments is a list of expressions
-        # print(f'calling {self.name} with {[a.value for a in arguments]}')
-        if not self.is_defined():
-            fail(f"Function '{self.name}' declared, but undefined")
-
-        global scope
-        global scope_num
-        global function_depth
-
-        if len(self.inputs) != len(arguments):
-            fail(f"Error in call of function {self.name}: expected {len(self.inputs)} args, but got"
-                    f" {len(arguments)}") # mismatched inputs
-
-        values = [expr.evaluate() for expr in arguments] # evaluate the function arguments
+    def set_lazy_body(self, body):
+        self.lazy_body = body
 
-        increase_depth() # increase depth by one, we're going into a function call
-
-        for key, val in zip(self.inputs.keys(), values):  # for every value in the function arguments
-            expr = Expression('value', val, None, None, lex.linenumber)
-            active_params[function_depth][key] = expr  # set the value in the current scope (which is 0) to the appropriate value
-
-        for key in self.outputs.keys():                   # same thing with function outputs
-            active_params[function_depth][key] = None  # but just set them to None for now, since we don't know what they are
-
-        for s in self.statements:
-            s.handle() # handle each statement in turn
-
-        outs = []
-        for name in self.outputs.keys():
-            val = get_var(name).evaluate() # evaluate the expression and rewrap the result in expression
-            outs.append(val) # during the function call, these variables were assigned values and we want to return these values
-        
-        if len(outs) == 1:
-            outs = outs[0]
-        expr = Expression('value', outs, None, None, lex.linenumber)
-        decrease_depth() # heading out of the function call, pop out of depth
-        # print(f'{self.name} returning {expr.evaluate()}')
-        return expr # return the outputs}}}
+    def is_defined(self):
+        return self._statements is not None or self.lazy_body is not None
+
+    def callees(self):
+        ''' Returns the names of the functions the body calls, without parsing it if it's lazy
+        '''
+        if self.lazy_body is not None:
+            return self.lazy_body.called
+        return called_names(self.statements)
+
+    def layout(self):
+        ''' Lays out the parameters: inputs first, then outputs. Returns the Scope the body is resolved in.
+        '''
+        scope = Scope(list(self.inputs.keys()) + list(self.outputs.keys()), in_function=True)
+        self.input_slots = [scope.lookup(name) for name in self.inputs.keys()]
+        self.output_slots = [scope.lookup(name) for name in self.outputs.keys()]
+        self.frame_size = scope.size
+        return scope
+
+    def resolve(self):
+        ''' Lays out the frame: the parameters, then every variable of the body
+        '''
+        scope = self.layout()
+        resolve_block(self.statements, scope, new_block=False)
+        self.frame_size = scope.size
+
+    def compile(self, functions):
+        self.resolve()
+        self.body = compile_tail_block(self.statements, self, functions)
+
+    def compile_lazily(self, functions):
+        ''' Leaves resolving and compiling the body to its first call, so a function which is never called
+            (most of an imported module, say) costs nothing. The parameters are laid out now, so the call can
+            fill them in, and the frame grows to the body's size once it's compiled.
+        '''
+        self.layout()
+        def first_call(frame):
+            if self.body is first_call: # otherwise a self tail call of the first call is back here
+                self.compile(functions)
+            frame.extend([None] * (self.frame_size - len(frame)))
+            return self.body(frame)
+        self.body = first_call
+
+    def call(self, *values): # values are the already evaluated arguments
+        frame = [None] * self.frame_size # one flat frame per call, indexed by the slots from resolve()
+
+        for slot, val in zip(self.input_slots, values):  # for every value in the function arguments
+            frame[slot] = val
+
+        for slot in self.output_slots:                   # same thing with function outputs
+            frame[slot] = None  # but just set them to None for now, since we don't know what they are
+
+        body = self.body
+        while body(frame): # a self tail call put its arguments in the frame, so the body runs again
+            pass
+
+        # during the function call, the outputs were assigned values and we want to return these values
+        if len(self.output_slots) == 1:
+            return frame[self.output_slots[0]]
+        return [frame[slot] for slot in self.output_slots]
+
+    def memoize(self, size):
+        ''' Replaces call on this instance with one going through a CallCache
+        '''
+        self.cache = CallCache(size)
+        self.call = self.cached_call
+
+    def cached_call(self, *values):
+        cache = self.cache
+        key = cache.key(values)
+        try:
+            result = cache.entries.get(key, cache)
+        except TypeError: # an unhashable argument can't be a key, so just make the call
+            return Function.call(self, *values)
+        if result is cache: # the cache itself marks a missing entry, since None is a valid result
+            cache.misses += 1
+            result = Function.call(self, *values)
+            cache.store(key, result)
+            return result
+        cache.hits += 1
+        cache.entries.move_to_end(key)
+        return result# }}}
 
 class AssignStatement():# {{{
     def __init__(self, name, expr, linenum):
         self.names = name
         self.expr = expr
         self.linenum = linenum
-
-    def handle(self):
-        global scope
-        global scope_num
-        global function_depth
-        global active_params
-        # print(self.expr.value)
-        values = self.expr.evaluate()
-        if not isinstance(values, list) and not isinstance(values, tuple): # makes it zippable with the associated names
-            values = [values]
-        if len(values) != len(self.names):
-            fail(f'Expected {len(self.names)} values, but got {len(values)}', self.linenum)
-
-        for n, v in zip(self.names, values):
-            expr = Expression('value', v, None, None, lex.linenumber)
-            depth, snum = is_var_defined(n)
-            if depth is None:
-                fail(f"Variable '{n}' hasn't been defined.", self.linenum)
-            set_var(n, expr, depth, snum)
+        self.slots = None
+
+    def resolve(self, scope):
+        self.expr.resolve(scope)
+        self.slots = [scope.lookup(n) for n in self.names]
+
+    def compile(self, functions):
+        expr = self.expr.compile(functions)
+        names = self.names
+        slots = self.slots
+        linenum = self.linenum
+
+        if len(slots) == 1 and slots[0] is not None:
+            slot, = slots
+            def run_assign(frame):
+                value = expr(frame)
+                if isinstance(value, list) or isinstance(value, tuple):
+                    if len(value) != 1:
+                        fail(f'Expected 1 values, but got {len(value)}', linenum)
+                    value = value[0]
+                frame[slot] = value
+            return run_assign
+
+        def run_assign(frame):
+            values = expr(frame)
+            if not isinstance(values, list) and not isinstance(values, tuple): # makes it zippable with the associated names
+                values = [values]
+            if len(values) != len(names):
+                fail(f'Expected {len(names)} values, but got {len(values)}', linenum)
+
+            for n, slot, v in zip(names, slots, values):
+                if slot is None:
+                    fail(f"Variable '{n}' hasn't been defined.", linenum)
+                frame[slot] = v
+        return run_assign
+
+    def is_tail_call(self, func):
+        ''' True if this assigns every output of func, in order, from a call of func itself. As the last
+            statement of func's body, the call can reuse the frame instead of making a new one.
+        '''
+        e = self.expr
+        return e.kind == 'function' and e.name == func.name \
+                and len(e.args) == len(func.inputs) and self.slots == func.output_slots
+
+    def compile_tail_call(self, func, functions):
+        args = tuple(a.compile(functions) for a in self.expr.args)
+        input_slots = func.input_slots
+        output_slots = func.output_slots
+
+        def run_tail_call(frame):
+            values = [a(frame) for a in args] # all evaluated in the old frame before any is overwritten
+            for slot, value in zip(input_slots, values):
+                frame[slot] = value
+            for slot in output_slots:
+                frame[slot] = None
+            return True
+        return run_tail_call
 # }}}
+
 class WhileStatement():# {{{
     def __init__(self, condition, statements, linenum):
         self.condition = condition
         self.statements = statements 
         self.linenum = linenum
 
-    def handle(self):
-        global scope_num
-        global scope
-        global function_depth
-        increase_scope()
-        while self.condition.evaluate():
-            for s in self.statements:
-                s.handle()
-        decrease_scope()
+    def resolve(self, scope):
+        self.condition.resolve(scope)
+        resolve_block(self.statements, scope)
+
+    def compile(self, functions):
+        condition = self.condition.compile(functions)
+        body = compile_block(self.statements, functions)
+
+        def run_while(frame):
+            while condition(frame):
+                body(frame)
+        return run_while
         # }}}
 
 class IfElseStatement():# {{{
@@ -251,16 +816,36 @@ class IfElseStatement():# {{{
         self.false_statements = false_statements
         self.linenum = linenum
 
-    def handle(self):
-        increase_scope()
-        if self.condition.evaluate():
-            for s in self.true_statements:
-                s.handle()
-        else:
-            if self.false_statements is not None:
-                for s in self.false_statements:
-                    s.handle()
-        decrease_scope()
+    def resolve(self, scope):
+        self.condition.resolve(scope)
+        resolve_block(self.true_statements, scope)
+        if self.false_statements is not None:
+            resolve_block(self.false_statements, scope)
+
+    def compile(self, functions, tail_of=None):
+        ''' If the statement is the last one of the function tail_of, both branches are compiled with
+            compile_tail_block, and their result is passed on
+        '''
+        condition = self.condition.compile(functions)
+        if tail_of is not None:
+            true_body = compile_tail_block(self.true_statements, tail_of, functions)
+            false_body = compile_tail_block(self.false_statements or [], tail_of, functions)
+
+            def run_if_else(frame):
+                if condition(frame):
+                    return true_body(frame)
+                return false_body(frame)
+            return run_if_else
+
+        true_body = compile_block(self.true_statements, functions)
+        false_body = compile_block(self.false_statements or [], functions)
+
+        def run_if_else(frame):
+            if condition(frame):
+                true_body(frame)
+            else:
+                false_body(frame)
+        return run_if_else
         # }}}
 
 class FunctionCallStatement():# {{{
@@ -269,86 +854,70 @@ class FunctionCallStatement():# {{{
         self.args = args
         self.linenum = linenum
 
-    def handle(self):
-        global known_functions
-        func = known_functions.get(self.name, None)
-        if func is None:
-            fail(f"Unknown function '{self.name}'", self.linenum)
-        return func.call(self.args) # it's just a call for side-effects, probably }}}
+    def resolve(self, scope):
+        for a in self.args:
+            a.resolve(scope)
+
+    def compile(self, functions):
+        return compile_call(functions, self.name, self.args, self.linenum) # it's just a call for side-effects, probably }}}
 
 class VariableDeclaration():# {{{
     def __init__(self, names, expr, linenum):
         self.names = names
         self.expr = expr
         self.linenum = linenum
-
-    def handle(self):
-        global scope
-        global scope_num
-        global function_depth
-
-        values = self.expr.evaluate()
-
-        if not isinstance(values, list):
-            values = [values]
-        if len(values) != len(self.names):
-            fail(f'Expected {len(self.names)} values, but got {len(values)}', self.linenum)
-
-        for n, v in zip(self.names, values):
-            depth, snum = is_var_defined(n)
-            if depth:
-                fail(f"Variable '{n}' already declared.", self.linenum)
-            # not already declared, so we're good to go
-            expr = Expression('value', v, None, None, lex.linenumber)
-
-            scope[function_depth][scope_num][n] = expr
+        self.slots = None
+        self.redeclared = None # name of a variable which is already visible, inside a function that's an error
+
+    def resolve(self, scope):
+        self.expr.resolve(scope) # the value can't see the variables it's declaring
+        self.slots = []
+        for n in self.names:
+            if scope.in_function and scope.lookup(n) is not None and self.redeclared is None:
+                self.redeclared = n
+            self.slots.append(scope.declare(n))
+
+    def compile(self, functions):
+        expr = self.expr.compile(functions)
+        names = self.names
+        slots = self.slots
+        linenum = self.linenum
+        redeclared = self.redeclared
+
+        def run_declaration(frame):
+            values = expr(frame)
+
+            # a single name keeps a tuple (e.g. from integer.divide) whole, several names unpack it
+            if not isinstance(values, list) and not (isinstance(values, tuple) and len(names) > 1):
+                values = [values]
+            if len(values) != len(names):
+                fail(f'Expected {len(names)} values, but got {len(values)}', linenum)
+            if redeclared is not None:
+                fail(f"Variable '{redeclared}' already declared.", linenum)
+
+            for slot, v in zip(slots, values):
+                frame[slot] = v
+        return run_declaration
 
     # }}}
 
 class PythonFunction(): #{{{
-    def __init__(self, name, func, inputs, outputs):
+    def __init__(self, name, func, inputs, outputs, pure=False, variadic=False):
         self.name = name
         self.func = func
         self.inputs = inputs 
         self.outputs = outputs 
-        global known_functions
-
-        if self.name in known_functions:
-            if known_functions[self.name].is_defined(): # we already have a defined function
-                fail(f"Function {self.name} has already been defined.") # redefinition of same function
-            elif not self.is_defined(): # function isn't defined, so are we defining it now?
-                fail(f"Function {self.name} has already been declared.") # no, so we're repeating a declaration
-            else: # we are providing a definition
-                known_functions[self.name] = self
+        self.pure = pure # no side effects, and the result only depends on the arguments
+        self.variadic = variadic # takes any number of arguments after its inputs
 
     def is_defined(self):
         return bool(self.func)
 
-    def call(self, arguments): # arguments is a list of expressions
-        # print(f'calling {self.name} with {[a.evaluate() for a in arguments]}')
-        if not self.is_defined():
-            fail(f"Function '{self.name}' declared, but undefined")
-
-        global scope
-        global scope_num
-        global function_depth
-         
-        if len(self.inputs) != len(arguments):
-            fail(f"Error in call of function {self.name}: expected {len(self.inputs)} args, but got"
-                    f" {len(arguments)}") # mismatched inputs
-        
-        if self.name == 'integer.add':
-            inps = [(a.kind, a.name, a.value) for a in arguments]
-            # print(inps)
-        outs = self.func(*[a.evaluate() for a in arguments])
-
-        expr = Expression('value', outs, None, None, lex.linenumber)
-        # print(f'{self.name} returning {expr.evaluate()}')
-        return expr # return the output Expression 
-
-    def save(self):
-        global known_functions
-        known_functions[self.name] = self # }}}
+    def call(self, *values): # values are the already evaluated arguments
+        return self.func(*values) # values are returned as they are, not wrapped in an Expression
+
+    def save(self, functions):
+        functions[self.name] = self # }}}
 
 
 ##### standard library #####
@@ -368,7 +937,7 @@ def divide(_temp_var_a, _temp_var_b):
     return _temp_var_a // _temp_var_b, _temp_var_a % _temp_var_b
 
 def sqrt(_temp_var_a):
-    return int(_temp_var_a ** .5)
+    return math.isqrt(_temp_var_a) # exact, where a float would round or overflow
 
 def equal(_temp_var_a, _temp_var_b):
     return _temp_var_a == _temp_var_b
@@ -378,441 +947,591 @@ def gcd(_temp_var_a, _temp_var_b):
        _temp_var_a, _temp_var_b = _temp_var_b, _temp_var_a % _temp_var_b 
    return _temp_var_a
 
+# integer builtins which the parser turns into 'operation' expressions instead of calls
+native_operations = {
+    'integer.add': add,
+    'integer.subtract': subtract,
+    'integer.multiply': multiply,
+    'integer.divide': divide,
+    'integer.sqrt': sqrt,
+    'integer.equal': equal,
+    'integer.gcd': gcd,
+}
 # }}}
 
 # linux system calls{{{
 def write(_filedesc, _string, _length):
-    _string = bytes(str(_string), 'utf-8').decode('unicode_escape').encode('utf-8')
-    try:
-        os.write(_filedesc, _string)
-    except Exception as e:
-        fail(f'Writing to {_filedesc} failed')
+    buffers.output.write(_filedesc, str(_string)) # escapes in literals were already decoded by the parser
     return _length
 
 def read(_filedesc, _numbytes):
-    _temp_buffer = os.read(_filedesc, _numbytes).decode('unicode_escape')
+    _temp_buffer = buffers.inputs.read(_filedesc, _numbytes) # served from the read-ahead buffer
     _count = len(_temp_buffer) 
     return _count, _temp_buffer
 
-def file_open(_filename, **_flags):
-    return open(_filename, **_flags).fileno()
-# }}}
+def readline(_filedesc):
+    _line = buffers.inputs.readline(_filedesc)
+    return len(_line), _line
 
-# string functions {{{
-
-def length(_string):
-    return len(str(_string))# }}}
+def file_open(_filename, _flags):
+    try:
+        _filedesc = os.open(str(_filename), _flags, 0o666)
+    except OSError:
+        fail(f'Opening {_filename} failed')
+    buffers.inputs.forget(_filedesc)
+    return _filedesc
+# }}}
 
-def initialize_known_functions():# {{{
+def builtin_functions():# {{{
+    ''' Returns a new function table holding the builtins, which every program starts from
+    '''
+    functions = {}
     ### integer functions ###
-    PythonFunction('integer.add', add, ['a','b'], ['a']).save()
-    PythonFunction('integer.subtract', subtract, ['a','b'], ['a']).save()
-    PythonFunction('integer.multiply', multiply, ['a','b'], ['a']).save()
-    PythonFunction('integer.divide', divide, ['a','b'], ['a']).save()
-    PythonFunction('integer.equal', equal, ['a','b'], ['a']).save()
-    PythonFunction('integer.sqrt', sqrt, ['a'], ['a']).save()
-    PythonFunction('integer.gcd', gcd, ['a','b'], ['a']).save()
+    PythonFunction('integer.add', add, ['a','b'], ['a'], pure=True).save(functions)
+    PythonFunction('integer.subtract', subtract, ['a','b'], ['a'], pure=True).save(functions)
+    PythonFunction('integer.multiply', multiply, ['a','b'], ['a'], pure=True).save(functions)
+    PythonFunction('integer.divide', divide, ['a','b'], ['a'], pure=True).save(functions)
+    PythonFunction('integer.equal', equal, ['a','b'], ['a'], pure=True).save(functions)
+    PythonFunction('integer.sqrt', sqrt, ['a'], ['a'], pure=True).save(functions)
+    PythonFunction('integer.gcd', gcd, ['a','b'], ['a'], pure=True).save(functions)
     ### linux system calls ###
-    PythonFunction('linux.write', write, ['num','str','len'], ['bytes']).save()
-    PythonFunction('linux.read', read, ['desc','num'], ['buf', 'var']).save()
-    PythonFunction('linux.open', file_open, ['fname','flags'], ['desc']).save()
+    PythonFunction('linux.write', write, ['num','str','len'], ['bytes']).save(functions)
+    PythonFunction('linux.read', read, ['desc','num'], ['buf', 'var']).save(functions)
+    PythonFunction('linux.readline', readline, ['desc'], ['num', 'line']).save(functions)
+    PythonFunction('linux.open', file_open, ['fname','flags'], ['desc']).save(functions)
     ### string functions ###
-    PythonFunction('string.length', length, ['str'], ['len']).save()
-
+    PythonFunction('string.length', strings.length, ['str'], ['len'], pure=True).save(functions)
+    PythonFunction('string.concat', strings.concat, ['a','b'], ['str'], pure=True).save(functions)
+    PythonFunction('string.substring', strings.substring, ['str','start','end'], ['str'], pure=True).save(functions)
+    PythonFunction('string.find', strings.find, ['str','sub'], ['index'], pure=True).save(functions)
+    PythonFunction('string.char_at', strings.char_at, ['str','index'], ['char'], pure=True).save(functions)
+    PythonFunction('string.to_integer', strings.to_integer, ['str'], ['num'], pure=True).save(functions)
+    PythonFunction('string.from_integer', strings.from_integer, ['num'], ['str'], pure=True).save(functions)
+    PythonFunction('string.builder', strings.builder, [], ['builder']).save(functions)
+    PythonFunction('string.append', strings.append, ['builder','str'], ['builder']).save(functions)
+    PythonFunction('string.build', strings.build, ['builder'], ['str']).save(functions)
+    ### vector functions, not pure: vectors change in place ###
+    PythonFunction('vector.new', vectors.new, ['size'], ['vec']).save(functions)
+    PythonFunction('vector.length', vectors.length, ['vec'], ['len']).save(functions)
+    PythonFunction('vector.get', vectors.get_item, ['vec','index'], ['value']).save(functions)
+    PythonFunction('vector.set', vectors.set_item, ['vec','index','value'], ['vec']).save(functions)
+    PythonFunction('vector.sum', vectors.total, ['vec'], ['sum']).save(functions)
+    PythonFunction('vector.add', vectors.add, ['a','b'], ['vec']).save(functions)
+    PythonFunction('vector.map_add', vectors.map_add, ['vec','value'], ['vec']).save(functions)
+    ### map functions, not pure either ###
+    PythonFunction('map.new', maps.new, [], ['map']).save(functions)
+    PythonFunction('map.size', maps.size, ['map'], ['size']).save(functions)
+    PythonFunction('map.has', maps.has, ['map','key'], ['found']).save(functions)
+    PythonFunction('map.get', maps.get, ['map','key'], ['value']).save(functions)
+    PythonFunction('map.put', maps.put, ['map','key','value'], ['map']).save(functions)
+    ### tasks, not pure: they run in turns, see tasks.py ###
+    PythonFunction('task.spawn', tasks.spawn, ['fname'], ['task'], variadic=True).save(functions)
+    PythonFunction('task.wait', tasks.wait, ['task'], ['outputs']).save(functions)
+    PythonFunction('task.yield', tasks.give_turn, [], ['zero']).save(functions)
+    ### parallel map, not pure itself: it fails unless the function it runs is pure ###
+    PythonFunction('parallel.map', parallel.map_range, ['fname','start','end'], ['vec']).save(functions)
+    return functions
+    # }}}
 
 
+class Parser:# {{{
+    ''' Recursive descent parser of one source text. Declared and defined functions go into the function
+        table functions, and the statements of the program section are appended to statements.
+    '''
+    def __init__(self, source, functions, statements, lazy=False):
+        self.source = source # a string, or the bytes (or mmap) of a source file
+        self.tokenizer = Tokenizer(source)
+        self.functions = functions
+        self.statements = statements
+        self.lazy = lazy # only skim function bodies, see LazyBody
+        self.module_name = 'main' # module name to prepend to functions
+        self.imports = []         # names of the modules in the imports section
+        self.exports = []         # names of the functions in the exports section
+
+    def parse(self):
+        self.main_module_exports()
+
+    def header(self):
+        ''' Returns what the parsed source says about itself: (module name, imported module names, names of the
+            exported functions)
+        '''
+        return self.module_name, self.imports, self.exports
+
+    def skim(self):
+        ''' First pass of streaming: parses the declarations and functions of a main module, but only skips
+            over its program section, and returns the Token the program's block starts with. Anything but a
+            main module is parsed whole, and None returned.
+        '''
+        tokenizer = self.tokenizer
+        if not tokenizer.try_match('main'):
+            self.main_module_exports()
+            return None
+        _ = tokenizer.must_match('main')
+        self.module_name = 'main'
+        if tokenizer.try_match('imports'):
+            self.imports_section()
+        self.declarations_section()
+        _ = tokenizer.must_match('program')
+        start = tokenizer.next_token()
+        self.skip_block()
+        self.functions_section()
+        return start
+
+    def program_statements(self, start):
+        ''' Second pass of streaming: parses the program block starting at the Token start again, yielding
+            each of its statements as soon as it's parsed
+        '''
+        self.module_name = 'main'
+        self.tokenizer = Tokenizer(self.source, start.offset, start.line, start.column)
+        _ = self.tokenizer.must_match('{')
+        while not self.tokenizer.try_match('}'):
+            yield self.statement()
+        _ = self.tokenizer.must_match('}')
+
+    def skip_block(self):
+        ''' Consumes a block, up to its matching '}', without parsing what's in it. Returns the names of the
+            functions called in it, going by the identifiers followed by '('.
+        '''
+        tokenizer = self.tokenizer
+        _ = tokenizer.must_match('{')
+        depth = 1
+        called = set()
+        previous = None
+        while depth:
+            token = tokenizer.next_token()
+            if token is None:
+                self.fail("Token '}' expected, but the source ended")
+            text = token.text
+            if text == '{':
+                depth += 1
+            elif text == '}':
+                depth -= 1
+            elif text == '(' and previous is not None and previous.kind == 'identifier' \
+                    and previous.text not in KEYWORDS:
+                name = previous.text
+                called.add(name if '.' in name else self.module_name + '.' + name)
+            previous = token
+            tokenizer.advance()
+        return called
+
+    def fail(self, message):
+        self.tokenizer.fail(message)
+
+    ##### sections #####
+    #==================#
+
+    def main_module_exports(self):# {{{
+        tokenizer = self.tokenizer
+
+        if tokenizer.try_match('main'):
+            _ = tokenizer.must_match('main')
+            self.module_name = 'main'
+            if tokenizer.try_match('imports'):
+                self.imports_section()
+            self.declarations_section()
+            self.program_section()
+            self.functions_section()
+        elif tokenizer.try_match('module'):
+            _ = tokenizer.must_match('module') # token = 'module'
+            token = tokenizer.must_match_regex(IDENTIFIER) # next token must be an identifier
+            self.module_name = token          # module name is that token
+            # section is exports
+            if tokenizer.try_match('exports'):
+                self.exports_section()
+            if tokenizer.try_match('imports'):
+                self.imports_section()
+            if tokenizer.try_match('declarations'): # functions which aren't exported
+                self.declarations_section()
+            self.functions_section()
+        elif tokenizer.try_match('imports'):
+            self.imports_section()
+            self.declarations_section()
+            self.functions_section()
+            # }}}
+
+    def program_section(self):# {{{
+        _ = self.tokenizer.must_match('program')
+        statements = self.statement_block()
+        for s in statements:
+            self.statements.append(s)
     # }}}
 
+    def exports_section(self):# {{{
+        _ = self.tokenizer.must_match('exports')
+        _ = self.tokenizer.must_match('{')
+        declared = len(self.functions)
+        self.function_declaration_list()
+        self.exports += list(self.functions)[declared:] # the function table keeps the order they were added in
+        _ = self.tokenizer.must_match('}')
+    # }}}
 
-##### sections #####
-#==================#
-
-def main_module_exports():# {{{
-    global current_module_name
-    global tokenizer
+    def imports_section(self):# {{{
+        _ = self.tokenizer.must_match('imports')
+        _ = self.tokenizer.must_match('{')
+        self.module_list()
+        _ = self.tokenizer.must_match('}')
+    # }}}
 
-    if tokenizer.try_match('main'):
-        _ = tokenizer.must_match('main')
-        current_module_name = 'main'
-        declarations_section()
-        program_section()
-        functions_section()
-    elif tokenizer.try_match('module'):
-        _ = tokenizer.must_match('module') # token = 'module'
-        token = tokenizer.must_match_regex(IDENTIFIER) # next token must be an identifier
-        current_module_name = token       # module name is that token
-        # section is exports
-        if tokenizer.try_match('exports'):
-            exports_section()
-    elif tokenizer.try_match('imports'):
-        imports_section()
-        declarations_section()
-        functions_section()
+    def declarations_section(self):# {{{
+        _ = self.tokenizer.must_match('declarations')
+        _ = self.tokenizer.must_match('{')
+        self.function_declaration_list()
+        _ = self.tokenizer.must_match('}')
         # }}}
 
-def program_section():# {{{
-    global statement_queue
-    global tokenizer
-    _ = tokenizer.must_match('program')
-    statements = statement_block()
-    for s in statements:
-        statement_queue.append(s)
-# }}}
+    def module_list(self):# {{{
+        ''' Matches the names of imported modules until '}' is found. They're only recorded here, and linked
+            in by modules.ModuleLoader once the whole source is parsed.
+        '''
+        while not self.tokenizer.try_match('}'):
+            token = self.tokenizer.must_match_regex(IDENTIFIER)
+            _ = self.tokenizer.must_match(';')
+            if token in self.imports:
+                self.fail(f"Module '{token}' is already imported.")
+            self.imports.append(token)
+    # }}}
 
-def exports_section():# {{{
-    global tokenizer
-    _ = tokenizer.must_match('exports')
-    _ = tokenizer.must_match('{')
-    function_declaration_list()
-    _ = tokenizer.must_match('}')
-# }}}
 
-def imports_section():# {{{
-    global tokenizer
-    _ = tokenizer.must_match('imports')
-    _ = tokenizer.must_match('{')
-    module_list()
-    _ = must_match('}')
-# }}}
+    ##### functions #####
+    #===================#
 
-def declarations_section():# {{{
-    global tokenizer
-    _ = tokenizer.must_match('declarations')
-    _ = tokenizer.must_match('{')
-    function_declaration_list()
-    _ = tokenizer.must_match('}')
+    def functions_section(self):# {{{
+        ''' Matches the section for function declarations
+        '''
+        _ = self.tokenizer.must_match('functions')
+        _ = self.tokenizer.must_match('{')
+        self.function_list()
+        _ = self.tokenizer.must_match('}')
     # }}}
 
-def module_list():# {{{
-    ''' Does nothing??? Just throws away some tokens?
-    '''
-    while not tokenizer.try_match('}'):
-        token = tokenizer.must_match_regex(IDENTIFIER)
-        _ = tokenizer.must_match(';')
-# }}}
-
-
-##### functions #####
-#===================#
+    def function(self):# {{{
+        ''' Matches a function definition, and sets the statements of its Function object
+        '''
+        tokenizer = self.tokenizer
 
-def functions_section():# {{{
-    ''' Matches the section for function declarations
-    '''
-    _ = tokenizer.must_match('functions')
-    _ = tokenizer.must_match('{')
-    function_list()
-    _ = tokenizer.must_match('}')
-# }}}
+        _ = tokenizer.must_match('(')
+        out_list = self.identifier_list()
+        _ = tokenizer.must_match(')')
+        _ = tokenizer.must_match('=')
 
-def function():# {{{
-    ''' Matches a function definition, and returns the Function object
-    '''
-    global current_module_name
-    global known_functions
-    global tokenizer
-
-    _ = tokenizer.must_match('(')
-    out_list = identifier_list()
-    _ = tokenizer.must_match(')')
-    _ = tokenizer.must_match('=')
-
-    name = tokenizer.must_match_regex(IDENTIFIER)
-    if '.' not in name:
-        module_with_dot = current_module_name + '.'
-        test_name = module_with_dot + name
-        name = test_name
-
-    # we can get rid of this error honestly, it doesn't matter for an interpreted language
-    if name not in known_functions: 
-        fail(f"Function '{name}' hasn't been declared, but is trying to be defined.")
-
-    _ = tokenizer.must_match('(')
-    in_list = identifier_list()
-    _ = tokenizer.must_match(')')
-
-    statements = statement_block() 
-    func = known_functions[name]
-    # set statements for the function, so it's now defined
-    func.set_statements(statements)
-# }}}
+        name = tokenizer.must_match_regex(IDENTIFIER)
+        if '.' not in name:
+            module_with_dot = self.module_name + '.'
+            test_name = module_with_dot + name
+            name = test_name
 
-def function_list():# {{{
-    ''' Matches functions until '}' is found, which marks the end of the functions section. 
-        Then, returns the list of functions.
-    '''
-    while not tokenizer.try_match('}'):
-        function()# }}}
+        # we can get rid of this error honestly, it doesn't matter for an interpreted language
+        if name not in self.functions:
+            self.fail(f"Function '{name}' hasn't been declared, but is trying to be defined.")
 
-def function_declaration():# {{{
-    ''' Matches the declaration of a single function, and adds its existance to global known_functions
-    '''
-    global known_functions
-    # syntax
-    token = tokenizer.must_match('(')
-    out_list = identifier_list()
-    token = tokenizer.must_match(')')
-    token = tokenizer.must_match('=')
-
-    # semantics
-    ident = tokenizer.must_match_regex(IDENTIFIER)
-    name = current_module_name + '.' + ident
-
-    # syntax
-    token = tokenizer.must_match('(')
-    in_list = identifier_list()
-    token = tokenizer.must_match(')')
-    token = tokenizer.must_match(';')
-
-    # add this function to "known functions"
-    func = Function(name, in_list, out_list, None) # not defined, so no statements
-    known_functions[name] = func
-# }}}
+        _ = tokenizer.must_match('(')
+        in_list = self.identifier_list()
+        _ = tokenizer.must_match(')')
 
-def function_declaration_list():# {{{
-    ''' Matches function declarations until '}' is found, adding them all to known functions immediately
-    '''
-    while not tokenizer.try_match('}'):
-        function_declaration()
-# }}}
+        func = self.functions[name]
+        if self.lazy: # find the end of the body now, and parse it on the first call
+            start = tokenizer.next_token()
+            func.set_lazy_body(LazyBody(self.source, start, self.module_name, self.functions, self.skip_block()))
+            return
+        statements = self.statement_block()
+        # set statements for the function, so it's now defined
+        func.set_statements(statements)
+    # }}}
 
-##### statements #####
-#====================#
+    def function_list(self):# {{{
+        ''' Matches functions until '}' is found, which marks the end of the functions section.
+        '''
+        while not self.tokenizer.try_match('}'):
+            self.function()# }}}
+
+    def function_declaration(self):# {{{
+        ''' Matches the declaration of a single function, and adds its existance to the function table
+        '''
+        tokenizer = self.tokenizer
+        # syntax
+        token = tokenizer.must_match('(')
+        out_list = self.identifier_list()
+        token = tokenizer.must_match(')')
+        token = tokenizer.must_match('=')
+
+        # semantics
+        ident = tokenizer.must_match_regex(IDENTIFIER)
+        name = self.module_name + '.' + ident
+
+        # syntax
+        token = tokenizer.must_match('(')
+        in_list = self.identifier_list()
+        token = tokenizer.must_match(')')
+        token = tokenizer.must_match(';')
+
+        if name in self.functions:
+            if self.functions[name].is_defined(): # we already have a defined function
+                self.fail(f"Function {name} has already been defined.") # redefinition of same function
+            self.fail(f"Function {name} has already been declared.") # repeating a declaration
+
+        # add this function to "known functions"
+        func = Function(name, in_list, out_list, None) # not defined, so no statements
+        self.functions[name] = func
+    # }}}
 
-def variable_declaration():# {{{
-    ''' Matches a variable declaration and returns the VariableDec statement object
-    '''
-    global tokenizer
-    token = tokenizer.must_match('var')
-    id_count = 0
-    singleton = False
-    name = ''
-    names = []
-    l = {}
-
-    if tokenizer.try_match_regex(IDENTIFIER): # only one declaration
-        # name of variable
-        name = tokenizer.must_match_regex(IDENTIFIER)
-        id_count += 1
-        singleton = True
-    else: # more than one declaration
-        _ = tokenizer.must_match('(')
-        l = identifier_list()
-        _ = tokenizer.must_match(')')
-        id_count = len(l)
+    def function_declaration_list(self):# {{{
+        ''' Matches function declarations until '}' is found, adding them all to known functions immediately
+        '''
+        while not self.tokenizer.try_match('}'):
+            self.function_declaration()
+    # }}}
 
-    _ = tokenizer.must_match('=')
-    expr = expression()
-    _ = tokenizer.must_match(';')
+    ##### statements #####
+    #====================#
+
+    def variable_declaration(self):# {{{
+        ''' Matches a variable declaration and returns the VariableDec statement object
+        '''
+        tokenizer = self.tokenizer
+        token = tokenizer.must_match('var')
+        id_count = 0
+        singleton = False
+        name = ''
+        names = []
+        l = {}
+
+        if tokenizer.try_match_regex(IDENTIFIER): # only one declaration
+            # name of variable
+            name = tokenizer.must_match_regex(IDENTIFIER)
+            id_count += 1
+            singleton = True
+        else: # more than one declaration
+            _ = tokenizer.must_match('(')
+            l = self.identifier_list()
+            _ = tokenizer.must_match(')')
+            id_count = len(l)
+
+        _ = tokenizer.must_match('=')
+        expr = self.expression()
+        _ = tokenizer.must_match(';')
 
-    stmt = None
-    if singleton:
-        stmt = VariableDeclaration([name], expr, lex.linenumber) # gotta use [name] because VariableDec expects a list of strings 
-    else:
-        names = list(l.keys()) #[::-1]
-        stmt = VariableDeclaration(names, expr, lex.linenumber) # there's >1 of them so add them all to the stack
+        stmt = None
+        if singleton:
+            stmt = VariableDeclaration([name], expr, tokenizer.linenumber) # gotta use [name] because VariableDec expects a list of strings
+        else:
+            names = list(l.keys()) #[::-1]
+            stmt = VariableDeclaration(names, expr, tokenizer.linenumber) # there's >1 of them so add them all to the stack
+
+        return stmt # }}}
+
+    def assignment_statement(self):# {{{
+        ''' Assigns a new value to an already existing variable (no 'var' keyword)
+        '''
+        tokenizer = self.tokenizer
+        l = {}
+        id_count = 0
+        singleton = False
+        if tokenizer.try_match_regex(IDENTIFIER):
+            id_count = 1;
+            name = tokenizer.must_match_regex(IDENTIFIER) # consume token
+            singleton = True
+        else:
+            _ = tokenizer.must_match('(')
+            l = self.identifier_list()
+            _ = tokenizer.must_match(')')
+            id_count = len(l)
 
-    return stmt # }}}
+        _ = tokenizer.must_match('=')
+        expr = self.expression()
+        _ = tokenizer.must_match(';')
 
-def assignment_statement():# {{{
-    ''' Assigns a new value to an already existing variable (no 'var' keyword)
-    '''
-    global tokenizer
-    l = {}
-    id_count = 0
-    singleton = False
-    if tokenizer.try_match_regex(IDENTIFIER):
-        id_count = 1;
-        name = tokenizer.must_match_regex(IDENTIFIER) # consume token
-        singleton = True
-    else:
+        stmt = None
+        if singleton:
+            stmt = AssignStatement([name], expr, tokenizer.linenumber)
+        else:
+            names = list(l.keys()) #[::-1]
+            stmt = AssignStatement(names, expr, tokenizer.linenumber)
+        return stmt# }}}
+
+    def if_else_statement(self):# {{{
+        tokenizer = self.tokenizer
+        # if (
+        _ = tokenizer.must_match('if')
+        _ = tokenizer.must_match('(')
+        # condition
+        expr = self.expression()
+        # )
+        _ = tokenizer.must_match(')')
+        # then
+        true_stmts = self.statement_block()
+        # initialize
+        false_stmts = None
+        # else (
+        if tokenizer.try_match('else'):
+            _ = tokenizer.must_match('else')
+            # then
+            false_stmts = self.statement_block()
+
+        # false_stmts might be none, but that is OK
+        # this is handled in the evaluation stage
+        if_else = IfElseStatement(expr, true_stmts, false_stmts, tokenizer.linenumber)
+        return if_else# }}}
+
+    def while_statement(self):# {{{
+        tokenizer = self.tokenizer
+        # while (
+        _ = tokenizer.must_match('while')
         _ = tokenizer.must_match('(')
-        l = identifier_list()
+        # condition
+        cond = self.expression()
+        # )
         _ = tokenizer.must_match(')')
-        id_count = len(l)
+        # then
+        statements = self.statement_block()
+        while_stmt = WhileStatement(cond, statements, tokenizer.linenumber)
 
-    _ = tokenizer.must_match('=')
-    expr = expression()
-    _ = tokenizer.must_match(';')
+        return while_stmt# }}}
 
-    stmt = None
-    if singleton:
-        stmt = AssignStatement([name], expr, lex.linenumber)
-    else:
-        names = list(l.keys()) #[::-1]
-        stmt = AssignStatement(names, expr, lex.linenumber)
-    return stmt# }}}
-
-def if_else_statement():# {{{
-    global tokenizer
-    # if (
-    _ = tokenizer.must_match('if')
-    _ = tokenizer.must_match('(')
-    # condition
-    expr = expression()
-    # )
-    _ = tokenizer.must_match(')')
-    # then
-    true_stmts = statement_block()
-    # initialize
-    false_stmts = None
-    # else (
-    if tokenizer.try_match('else'):
-        _ = tokenizer.must_match('else')
-        # then
-        false_stmts = statement_block()
-
-    # false_stmts might be none, but that is OK
-    # this is handled in the evaluation stage
-    if_else = IfElseStatement(expr, true_stmts, false_stmts, lex.linenumber)
-    return if_else# }}}
-
-def while_statement():# {{{
-    # while (
-    _ = tokenizer.must_match('while')
-    _ = tokenizer.must_match('(')
-    # condition
-    cond = expression()
-    # )
-    _ = tokenizer.must_match(')')
-    # then 
-    statements = statement_block()
-    while_stmt = WhileStatement(cond, statements, lex.linenumber)
-
-    return while_stmt# }}}
-
-def statement_block():# {{{
-    ''' Returns a list of Statement objects (in order)
-    '''
-    # should increase scope number here, but we instead handle it during evalutation stage
-    _ = tokenizer.must_match('{')
-    statements = statement_list()
-    _ = tokenizer.must_match('}')
+    def statement_block(self):# {{{
+        ''' Returns a list of Statement objects (in order)
+        '''
+        # should increase scope number here, but we instead handle it during evalutation stage
+        _ = self.tokenizer.must_match('{')
+        statements = self.statement_list()
+        _ = self.tokenizer.must_match('}')
 
-    return statements # }}}
+        return statements # }}}
 
-def statement_list():# {{{
-    # global active_parameter_list
-    statements = []
-    while not tokenizer.try_match('}'):
-        stmt = None
+    def statement_list(self):# {{{
+        statements = []
+        while not self.tokenizer.try_match('}'):
+            statements.append(self.statement())
+
+        # return the gathered statements
+        return statements # }}}
+
+    def statement(self):# {{{
+        ''' Matches a single statement (a block being one), and returns it
+        '''
+        tokenizer = self.tokenizer
         if tokenizer.try_match('var'):
-            stmt = variable_declaration()
+            return self.variable_declaration()
         elif tokenizer.try_match('{'):
-            stmt = statement_block()
+            return self.statement_block()
         elif tokenizer.try_match('if'):
-            stmt = if_else_statement()
+            return self.if_else_statement()
         elif tokenizer.try_match('while'):
-            stmt = while_statement()
+            return self.while_statement()
         elif tokenizer.try_match('('):
-            stmt = assignment_statement()
+            return self.assignment_statement()
         elif tokenizer.try_match_regex(IDENTIFIER):
             if tokenizer.try_lookahead('('):
-                stmt = function_call_statement() # just for side effects
+                stmt = self.function_call_statement() # just for side effects
                 _ = tokenizer.must_match(';')
+                return stmt
             elif tokenizer.try_lookahead('='):
-                stmt = assignment_statement()
-            else:
-                fail("statement_list: Expected a statement")
-        else:
-            fail("statement_list: Expected a statement")
-        # no matter what, add the statement to the list
-        statements.append(stmt)
-
-    # return the gathered statements 
-    return statements # }}}
+                return self.assignment_statement()
+        self.fail("statement_list: Expected a statement")# }}}
 
 
-##### expressions #####
-#=====================#
+    ##### expressions #####
+    #=====================#
 
-def expression():# {{{
-    global tokenizer
-    # we have a number!
-    if tokenizer.try_match_regex(NUMBER):
-        token = tokenizer.must_match_regex(NUMBER)
-        return Expression('value', int(token), None, None, lex.linenumber)
-
-    # we have a string!
-    if tokenizer.try_match_regex(STRING_LITERAL):
-        token = tokenizer.must_match_regex(STRING_LITERAL)
-        return Expression('value', token.strip('"'), None, None, lex.linenumber) # get rid of "s around the string with strip
-
-    if tokenizer.try_match_regex(IDENTIFIER):
-        # we found a function
-        if tokenizer.try_lookahead('('):
-            return function_call() # return the outcome of function call (expr)
-        # we found a variable
-        else:
-            name = tokenizer.must_match_regex(IDENTIFIER)
-            return Expression('variable', None, name, None, lex.linenumber)
-    fail("That's not an expression")# }}}
+    def expression(self):# {{{
+        tokenizer = self.tokenizer
+        # we have a number!
+        if tokenizer.try_match_regex(NUMBER):
+            token = tokenizer.must_match_regex(NUMBER)
+            return Expression('value', int(token), None, None, tokenizer.linenumber)
 
-def function_call():# {{{
-    ''' Matches and builds an expression with type function call
-    '''
-    global current_module_name
-    global tokenizer
+        # we have a string!
+        if tokenizer.try_match_regex(STRING_LITERAL):
+            token = tokenizer.must_match_regex(STRING_LITERAL)
+            text = self.decode_escapes(token.strip('"')) # get rid of "s around the string with strip
+            return Expression('value', text, None, None, tokenizer.linenumber)
 
-    name = tokenizer.must_match_regex(IDENTIFIER)
+        if tokenizer.try_match_regex(IDENTIFIER):
+            # we found a function
+            if tokenizer.try_lookahead('('):
+                return self.function_call() # return the outcome of function call (expr)
+            # we found a variable
+            else:
+                name = tokenizer.must_match_regex(IDENTIFIER)
+                return Expression('variable', None, name, None, tokenizer.linenumber)
+        self.fail("That's not an expression")# }}}
+
+    def decode_escapes(self, text):# {{{
+        ''' Decodes the escape sequences (\\n, \\t, ...) in the text of a string literal, once, at parse time
+        '''
+        try:
+            # characters outside latin-1 become escapes themselves, so decoding gives them back unchanged
+            return text.encode('latin-1', 'backslashreplace').decode('unicode_escape')
+        except UnicodeDecodeError:
+            self.fail(f'Invalid escape sequence in string literal "{text}"')# }}}
+
+    def function_call(self):# {{{
+        ''' Matches and builds an expression with type function call
+        '''
+        tokenizer = self.tokenizer
 
-    if '.' not in name:
-        module_with_dot = current_module_name + '.'
-        test_name = module_with_dot + name
-        name = test_name
+        name = tokenizer.must_match_regex(IDENTIFIER)
 
-    _ = tokenizer.must_match('(')
-    arguments = argument_list()
-    _ = tokenizer.must_match(')')
+        if '.' not in name:
+            module_with_dot = self.module_name + '.'
+            test_name = module_with_dot + name
+            name = test_name
 
-    func = Expression('function', None, name, arguments, lex.linenumber)
-    # stmt = FunctionCallStatement(name, arguments)
-    return func# }}}
+        _ = tokenizer.must_match('(')
+        arguments = self.argument_list()
+        _ = tokenizer.must_match(')')
 
-def function_call_statement(): #{{{
-    ''' Matches and builds a statement with type function call
-    '''
-    global current_module_name
-    global tokenizer
+        # the name still refers to the integer builtin, so it can be run as an operation instead of a call
+        func = self.functions.get(name, None)
+        if name in native_operations and isinstance(func, PythonFunction) and func.func is native_operations[name] \
+                and len(arguments) == len(func.inputs):
+            return Expression('operation', None, name, arguments, tokenizer.linenumber)
 
-    name = tokenizer.must_match_regex(IDENTIFIER)
+        func = Expression('function', None, name, arguments, tokenizer.linenumber)
+        # stmt = FunctionCallStatement(name, arguments)
+        return func# }}}
 
-    if '.' not in name:
-        module_with_dot = current_module_name + '.'
-        test_name = module_with_dot + name
-        name = test_name
+    def function_call_statement(self): #{{{
+        ''' Matches and builds a statement with type function call
+        '''
+        tokenizer = self.tokenizer
 
-    _ = tokenizer.must_match('(')
-    arguments = argument_list()
-    _ = tokenizer.must_match(')')
+        name = tokenizer.must_match_regex(IDENTIFIER)
 
-    # func = Expression('function', None, name, arguments)
-    stmt = FunctionCallStatement(name, arguments, lex.linenumber)
-    return stmt# }}}
+        if '.' not in name:
+            module_with_dot = self.module_name + '.'
+            test_name = module_with_dot + name
+            name = test_name
 
-def argument():# {{{
-    ''' Does nothing...literally. I'll keep it here for completeness
-    '''
-    pass# }}}
-
-def argument_list():# {{{
-    global tokenizer
-    arguments = []
-    while not tokenizer.try_match(')'):
-        expr = expression()
-        arguments.append(expr)
-        if tokenizer.try_match(')'):
-            break
-        _ = tokenizer.must_match(',')
-    return arguments# }}}
-
-def identifier_list():# {{{
-    global tokenizer
-    l = {}
-    while not tokenizer.try_match(')'):
-        token = tokenizer.must_match_regex(IDENTIFIER)
-        l[token] = ''
-        if tokenizer.try_match(')'):
-            break
-        token = tokenizer.must_match(',')
-    return l# }}}
+        _ = tokenizer.must_match('(')
+        arguments = self.argument_list()
+        _ = tokenizer.must_match(')')
 
+        # func = Expression('function', None, name, arguments)
+        stmt = FunctionCallStatement(name, arguments, tokenizer.linenumber)
+        return stmt# }}}
+
+    def argument(self):# {{{
+        ''' Does nothing...literally. I'll keep it here for completeness
+        '''
+        pass# }}}
+
+    def argument_list(self):# {{{
+        arguments = []
+        while not self.tokenizer.try_match(')'):
+            expr = self.expression()
+            arguments.append(expr)
+            if self.tokenizer.try_match(')'):
+                break
+            _ = self.tokenizer.must_match(',')
+        return arguments# }}}
+
+    def identifier_list(self):# {{{
+        l = {}
+        while not self.tokenizer.try_match(')'):
+            token = self.tokenizer.must_match_regex(IDENTIFIER)
+            l[token] = ''
+            if self.tokenizer.try_match(')'):
+                break
+            token = self.tokenizer.must_match(',')
+        return l# }}}
+# }}}
@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+''' Profiler of Pleasant programs, for --profile. It instruments a program's function table and statements
+    before they're compiled into closures, so an unprofiled program compiles to exactly the closures it
+    always did and pays nothing for it.
+'''
+import time
+from collections import defaultdict
+import parser
+import tasks
+
+
+class FunctionStats:# {{{
+    ''' Totals of one function. inclusive counts the time of its callees too, but only once for recursive
+        calls, exclusive only the time spent in the function itself.
+    '''
+    def __init__(self):
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0# }}}
+
+class CallStack:# {{{
+    ''' The calls being made by one task, as [path, start, callee time, stats, name] records, and how many
+        calls of each function are on it
+    '''
+    __slots__ = ('calls', 'active')
+
+    def __init__(self):
+        self.calls = []
+        self.active = defaultdict(int)# }}}
+
+
+class Profiler:# {{{
+    ''' Keeps a CallStack of the calls being made. A path is the number of a call stack, root to callee, so
+        the stacks can be written out for flame graphs without joining names on every call. Each task the
+        program spawns has a CallStack of its own, rooted at its function rather than at the program, and the
+        time it's suspended counts like time blocked in a read.
+    '''
+    def __init__(self):
+        self.functions = defaultdict(FunctionStats)
+        self.lines = defaultdict(int)   # line number -> statements run on that line
+        self.paths = {}                 # (parent path, name) -> path
+        self.path_names = [None]        # path -> (parent path, name)
+        self.path_time = [0.0]          # path -> exclusive time
+        self.stack = CallStack()        # of the program, which is task 0 once it spawns others
+        self.task_stacks = {}           # spawned Task -> CallStack
+        self.clock = time.perf_counter
+
+    ##### instrumenting #####
+
+    def instrument(self, functions, statements):
+        ''' Wraps the call of every function in the table, and the compile methods of every statement so the
+            compiled statements count their line
+        '''
+        for func in functions.values():
+            func.call = self.wrap_call(func.name, func.call)
+            if isinstance(func, parser.Function) and func.lazy_body is not None:
+                func.lazy_body.transforms.append(self.instrument_parsed)
+            elif isinstance(func, parser.Function) and func.is_defined():
+                self.instrument_block(func.statements)
+        self.instrument_block(statements)
+
+    def instrument_parsed(self, statements):
+        ''' Instruments a lazy function body once it's parsed
+        '''
+        self.instrument_block(statements)
+        return statements
+
+    def instrument_stream(self, statements):
+        ''' Instruments each statement of an iterator as it's yielded, for a streamed program section
+        '''
+        for s in statements:
+            self.instrument_block([s])
+            yield s
+
+    def instrument_block(self, statements):
+        for s in statements:
+            if isinstance(s, list):
+                self.instrument_block(s)
+                continue
+            s.compile = self.wrap_compile(s.linenum, s.compile)
+            if isinstance(s, parser.AssignStatement):
+                s.compile_tail_call = self.wrap_compile(s.linenum, s.compile_tail_call)
+            elif isinstance(s, parser.WhileStatement):
+                self.instrument_block(s.statements)
+            elif isinstance(s, parser.IfElseStatement):
+                self.instrument_block(s.true_statements)
+                self.instrument_block(s.false_statements or [])
+
+    def wrap_compile(self, linenum, compile):
+        lines = self.lines
+        def compile_counted(*args, **kwargs):
+            step = compile(*args, **kwargs)
+            def counted(frame):
+                lines[linenum] += 1
+                return step(frame)
+            return counted
+        return compile_counted
+
+    def wrap_call(self, name, call):
+        enter = self.enter
+        leave = self.leave
+        def profiled_call(*values):
+            enter(name)
+            try:
+                return call(*values)
+            finally:
+                leave()
+        return profiled_call
+
+    ##### recording #####
+
+    def current_stack(self):
+        ''' Returns the stack of the running task
+        '''
+        task = getattr(tasks.local, 'task', None)
+        if task is None or task is task.scheduler.main:
+            return self.stack
+        stack = self.task_stacks.get(task, None)
+        if stack is None:
+            stack = self.task_stacks[task] = CallStack()
+        return stack
+
+    def enter(self, name):
+        stack = self.stack if not tasks.active else self.current_stack()
+        calls = stack.calls
+        parent = calls[-1][0] if calls else 0
+        key = (parent, name)
+        path = self.paths.get(key, None)
+        if path is None:
+            path = self.paths[key] = len(self.path_names)
+            self.path_names.append(key)
+            self.path_time.append(0.0)
+        stats = self.functions[name]
+        stats.calls += 1
+        stack.active[name] += 1
+        calls.append([path, self.clock(), 0.0, stats, name])
+
+    def leave(self):
+        stack = self.stack if not tasks.active else self.current_stack()
+        self.pop(stack)
+
+    def pop(self, stack):
+        calls = stack.calls
+        path, start, callees, stats, name = calls.pop()
+        elapsed = self.clock() - start
+        stack.active[name] -= 1
+        if stack.active[name] == 0: # the outermost of recursive calls covers the inner ones
+            stats.inclusive += elapsed
+        stats.exclusive += elapsed - callees
+        self.path_time[path] += elapsed - callees
+        if calls:
+            calls[-1][2] += elapsed
+
+    def start(self):
+        self.enter('program')
+
+    def stop(self):
+        for stack in [self.stack, *self.task_stacks.values()]:
+            while stack.calls: # a failing program leaves its calls on the stack
+                self.pop(stack)
+
+    ##### reporting #####
+
+    def report(self, top=20):
+        ''' Returns the lines of a report: every function by exclusive time, and the most run lines
+        '''
+        lines = [f"{'function':<32} {'calls':>10} {'inclusive ms':>14} {'exclusive ms':>14} {'us/call':>10}"]
+        by_time = sorted(self.functions.items(), key=lambda item: item[1].exclusive, reverse=True)
+        for name, stats in by_time:
+            per_call = stats.inclusive / stats.calls * 1e6 if stats.calls else 0
+            lines.append(f'{name:<32} {stats.calls:>10} {stats.inclusive * 1000:>14.3f} '
+                         f'{stats.exclusive * 1000:>14.3f} {per_call:>10.2f}')
+        lines += ['', f"{'line':>8} {'hits':>12}"]
+        by_hits = sorted(self.lines.items(), key=lambda item: item[1], reverse=True)
+        for linenum, hits in by_hits[:top]:
+            lines.append(f'{linenum:>8} {hits:>12}')
+        return lines
+
+    def collapsed_stacks(self):
+        ''' Returns the lines of the collapsed stack format read by flamegraph.pl and speedscope: each call
+            stack with the microseconds spent in its innermost function
+        '''
+        names = {0: ''}
+        lines = []
+        for path in range(1, len(self.path_names)):
+            parent, name = self.path_names[path]
+            names[path] = name if parent == 0 else names[parent] + ';' + name
+            micros = round(self.path_time[path] * 1e6)
+            if micros > 0:
+                lines.append(f'{names[path]} {micros}')
+        return lines
+
+    def write_stacks(self, filename):
+        with open(filename, 'w') as f:
+            for line in self.collapsed_stacks():
+                f.write(line + '\n')# }}}
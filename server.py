@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+''' Interpreter server: a daemon listening on a Unix socket, which runs the programs sent by client.py on
+    a pool of worker processes. A worker keeps each program it has run loaded and compiled, with the modules
+    it imports, and runs it again as it is while none of their files have changed. So a request costs a
+    socket round trip and the run itself, not starting Python, importing the interpreter and parsing.
+
+    $ ./interpreter --serve SOCKET [-j N] [options]
+    $ ./client.py SOCKET <source_file.main> < input
+
+    Each connection sends two messages (see client.py): a JSON header {"path": ...} and the program's
+    stdin. The server answers with three: a JSON header {"status": ...}, then the program's stdout and
+    stderr. The status is 0 if the program finished and 1 if it failed.
+'''
+import os
+import json
+import signal
+import tempfile
+import socketserver
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import parser
+import batch
+import buffers
+from client import send_message, receive_message
+
+WARM_PROGRAMS = 64  # programs each worker keeps loaded, least recently run ones are dropped first
+
+
+##### workers #####
+#=================#
+
+warm = OrderedDict() # in each worker: path -> (stamps, Interpreter)
+
+def file_stamps(filenames):# {{{
+    ''' What a loaded program depends on: the modification time and size of each of its files
+    '''
+    stamps = []
+    for filename in filenames:
+        try:
+            st = os.stat(filename)
+            stamps.append((filename, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamps.append((filename, None, None))
+    return tuple(stamps)# }}}
+
+def program_files(path, interp):# {{{
+    return [path] + [m.filename for m in interp.modules.modules.values()]# }}}
+
+def warm_interpreter(path):# {{{
+    ''' Returns the Interpreter path was last run on, if neither it nor its modules changed since, or None
+    '''
+    entry = warm.get(path, None)
+    if entry is None:
+        return None
+    stamps, interp = entry
+    if file_stamps(program_files(path, interp)) != stamps:
+        del warm[path]
+        return None
+    warm.move_to_end(path)
+    return interp# }}}
+
+def run_request(path, stdin, options):# {{{
+    ''' Runs the program at path in a worker with stdin (bytes) as its input, and returns its
+        (status, stdout, stderr)
+    '''
+    with tempfile.TemporaryFile() as inp, tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        inp.write(stdin)
+        inp.seek(0)
+        with batch.redirected(inp, out, err):
+            buffers.configure_output(options.flush, options.buffer_size)
+            interp = warm_interpreter(path)
+            if interp is not None:
+                error = batch.run_interpreter(interp)
+            else:
+                interp = batch.new_interpreter(options)
+                stamp = file_stamps([path]) # before loading, so a change while it loads is seen next time
+                error = batch.run_interpreter(interp, lambda: interp.load_file(path))
+                if interp.program is not None: # it loaded and compiled, whether or not it then failed
+                    warm[path] = (stamp + file_stamps(program_files(path, interp)[1:]), interp)
+                    if len(warm) > WARM_PROGRAMS:
+                        warm.popitem(last=False)
+        out.seek(0)
+        err.seek(0)
+        return (0 if error is None else 1), out.read(), err.read()# }}}
+
+
+##### server #####
+#================#
+
+class RequestHandler(socketserver.BaseRequestHandler):# {{{
+    ''' Handles one connection on a thread of the server, waiting for a worker to run its program
+    '''
+    def handle(self):
+        try:
+            header = json.loads(receive_message(self.request))
+            stdin = receive_message(self.request)
+        except (ConnectionError, ValueError):
+            return # the client went away, or isn't speaking the protocol
+        try:
+            status, stdout, stderr = self.server.executor.submit(run_request, header['path'], stdin,
+                                                                 self.server.options).result()
+        except Exception as e: # a worker died, or the header had no path
+            status, stdout, stderr = 2, b'', f'Server error: {e}\n'.encode('utf-8')
+        try:
+            send_message(self.request, json.dumps({'status': status}).encode('utf-8'))
+            send_message(self.request, stdout)
+            send_message(self.request, stderr)
+        except OSError:
+            pass# }}}
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):# {{{
+    daemon_threads = True
+
+    def __init__(self, socket_path, options, executor):
+        self.options = options
+        self.executor = executor
+        socketserver.UnixStreamServer.__init__(self, socket_path, RequestHandler)# }}}
+
+def stop(signum, frame):# {{{
+    raise KeyboardInterrupt # shuts down like ^C does# }}}
+
+def serve(socket_path, options, jobs=None):# {{{
+    ''' Serves requests on socket_path with jobs worker processes (one per CPU by default), until the
+        process gets SIGINT or SIGTERM
+    '''
+    if os.path.exists(socket_path):
+        os.remove(socket_path) # left behind by a server which didn't shut down
+    signal.signal(signal.SIGTERM, stop)
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=parser.allow_long_integers)
+    with executor, Server(socket_path, options, executor) as server:
+        print(f'Serving on {socket_path}', flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)# }}}
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+''' The string.* builtins, and the builder behind string.builder for building long text piece by piece
+'''
+import re
+from lexer import fail
+
+
+CHUNK_PIECES = 1024     # appended pieces joined into one chunk at a time
+INTEGER = re.compile('-?[0-9]+')
+
+
+class Builder:# {{{
+    ''' A string built by appending, passed by reference like a vector. It's a rope of sorts: the pieces are
+        kept in a list and only joined when the text is needed, so appending in a loop is amortized O(1)
+        instead of copying the text so far every time. Every CHUNK_PIECES pieces are joined into one chunk,
+        so a million short appends don't keep a million str objects around.
+    '''
+    __slots__ = ('chunks', 'pieces', 'length')
+    __hash__ = None # changes in place, so it can't be a memoization key
+
+    def __init__(self):
+        self.chunks = []
+        self.pieces = []
+        self.length = 0
+
+    def append(self, value):
+        piece = text(value)
+        self.pieces.append(piece)
+        self.length += len(piece)
+        if len(self.pieces) == CHUNK_PIECES:
+            self.chunks.append(''.join(self.pieces))
+            self.pieces = []
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        if len(self.chunks) + len(self.pieces) != 1:
+            self.chunks = [''.join(self.chunks + self.pieces)] # joined once, until something else is appended
+            self.pieces = []
+        return (self.chunks or self.pieces)[0]
+
+    def __repr__(self):
+        return f'Builder({str(self)!r})'# }}}
+
+def text(value):# {{{
+    ''' Returns value as a str. Integers (and anything else) are converted, a str is returned as it is.
+    '''
+    return value if type(value) is str else str(value)# }}}
+
+def check_index(string, index, name, end=False):# {{{
+    ''' Fails unless index is a position in string, or its end if end is set
+    '''
+    last = len(string) if end else len(string) - 1
+    if not isinstance(index, int) or not 0 <= index <= last:
+        fail(f'{name}: index {index} out of range of a string of length {len(string)}')
+    return index# }}}
+
+
+##### builtins #####
+#==================#
+
+def length(_string):
+    if type(_string) is str or type(_string) is Builder:
+        return len(_string)
+    return len(str(_string)) # the digits of an integer
+
+def concat(_string_a, _string_b):
+    return text(_string_a) + text(_string_b)
+
+def substring(_string, _start, _end):
+    _string = text(_string)
+    check_index(_string, _start, 'string.substring', end=True)
+    check_index(_string, _end, 'string.substring', end=True)
+    if _end < _start:
+        fail(f'string.substring: end {_end} is before start {_start}')
+    return _string[_start:_end]
+
+def find(_string, _substring):
+    return text(_string).find(text(_substring)) # -1 if it isn't there
+
+def char_at(_string, _index):
+    _string = text(_string)
+    return _string[check_index(_string, _index, 'string.char_at')]
+
+def to_integer(_string):
+    _string = text(_string)
+    if not INTEGER.fullmatch(_string):
+        fail(f'string.to_integer: {_string!r} is not an integer')
+    return int(_string)
+
+def from_integer(_integer):
+    if not isinstance(_integer, int):
+        fail(f'string.from_integer expected an integer, but got {_integer!r}')
+    return str(int(_integer)) # True is 1
+
+def builder():
+    return Builder()
+
+def append(_builder, _string):
+    if not isinstance(_builder, Builder):
+        fail(f'string.append expected a builder, but got {_builder!r}')
+    _builder.append(_string)
+    return _builder
+
+def build(_builder):
+    return text(_builder)
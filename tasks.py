@@ -0,0 +1,333 @@
+#!/usr/bin/python3
+''' Cooperative tasks behind the task.* builtins, so a program can read from several pipes (or write to them)
+    at once instead of blocking on one at a time.
+
+    task.spawn(name, args...) starts a task running the function name on args, and returns its number.
+    Only one task of a program runs at a time: it runs until it waits for another task (task.wait), gives
+    the others a turn (task.yield), or would block in linux.read, linux.readline or linux.write. Then it's
+    suspended, and the next ready task runs. When none is ready, an asyncio event loop waits until one of the
+    descriptors the suspended tasks wait on is ready, and resumes that task.
+
+    Each task runs on a thread of its own, which only runs while it has the turn, so a task keeps its
+    Python stack (the compiled closures of its calls, and its recursion depth) or its VM stack and frames
+    while it's suspended. Nothing else about the interpreter is per task: the functions, their compiled code
+    and memoized results are shared, and a task switch never happens in the middle of compiling or caching.
+'''
+import threading
+import contextlib
+from collections import deque
+from lexer import fail, ParsingException
+import parser
+
+
+local = threading.local()   # .task: the Task running on this thread, .program: the Program it's part of
+active = 0                  # schedulers running in the process, while there are none I/O never looks for a task
+
+
+class Program:# {{{
+    ''' What builtins need of the running program: its function table, how to call one of its functions by
+        name on the backend it runs on, with call(name, args), and check_calls(names), which fails unless the
+        program imports the functions names (see modules.ModuleLoader.check_calls)
+    '''
+    __slots__ = ('functions', 'call', 'check_calls', 'cleanups', 'pool')
+
+    def __init__(self, functions, call, check_calls=None):
+        self.functions = functions
+        self.call = call
+        self.check_calls = check_calls
+        self.cleanups = [] # run when the program ends
+        self.pool = None   # worker processes of parallel.map, see parallel.py
+
+    def find(self, name, nargs, builtin):
+        ''' Returns the function name, which builtin runs, failing if the program couldn't call it itself
+        '''
+        return find_function(self.functions, name, nargs, builtin, self.check_calls)# }}}
+
+class Cancelled(BaseException):# {{{
+    ''' Raised in the suspended tasks of a program which failed, so their threads end
+    '''# }}}
+
+class Task:# {{{
+    __slots__ = ('number', 'scheduler', 'turn', 'done', 'result', 'error', 'waiters')
+
+    def __init__(self, number, scheduler):
+        self.number = number
+        self.scheduler = scheduler
+        self.turn = threading.Semaphore(0)  # released when it's this task's turn to run
+        self.done = False
+        self.result = None      # outputs of its function, once done
+        self.error = None       # what it failed with, if it did
+        self.waiters = []       # tasks suspended in task.wait on it# }}}
+
+class Scheduler:# {{{
+    ''' Runs the tasks of one program, one at a time. The thread which ran the program is task 0, and the
+        scheduler is only created by its first task.spawn, so a program without tasks never has one.
+    '''
+    def __init__(self, program):
+        import asyncio # only programs with tasks pay for importing it
+        self.program = program
+        self.loop = asyncio.new_event_loop()
+        self.ready = deque()        # tasks waiting for their turn, in order
+        self.tasks = []             # every task, by number
+        self.readers = {}           # fd -> tasks suspended until it can be read
+        self.writers = {}           # fd -> tasks suspended until it can be written
+        self.io_waits = 0           # tasks in readers and writers
+        self.wakeup = None          # future the loop runs until, set when a task is ready
+        self.failure = None         # error the program failed with, once it has
+        self.main = self.new_task()
+        self.current = self.main
+
+    def new_task(self):
+        task = Task(len(self.tasks), self)
+        self.tasks.append(task)
+        return task
+
+    ##### switching #####
+
+    def next_ready(self):
+        ''' Returns the next task to run, waiting on the event loop while none is ready. A task waiting for
+            a descriptor is resumed as soon as it's ready, even while other tasks keep yielding to each other.
+        '''
+        if self.io_waits and self.ready:
+            self.poll(0)
+        while not self.ready:
+            if not self.io_waits:
+                fail('Every task is waiting for another one to finish')
+            self.poll(None)
+        return self.ready.popleft()
+
+    def poll(self, timeout):
+        self.wakeup = self.loop.create_future()
+        if timeout is None:
+            self.loop.run_until_complete(self.wakeup)
+        else:
+            self.loop.call_later(timeout, self.wake)
+            self.loop.run_until_complete(self.wakeup)
+
+    def wake(self):
+        if self.wakeup is not None and not self.wakeup.done():
+            self.wakeup.set_result(None)
+
+    def switch(self):
+        ''' Suspends the running task and hands the turn to the next ready one. Returns once the running task
+            has been resumed.
+        '''
+        me = self.current
+        try:
+            task = self.next_ready()
+        except ParsingException as e:
+            if me is self.main:
+                raise
+            self.failure = e # a deadlock, which the program fails with
+            task = self.main
+        if task is not me:
+            self.current = task
+            task.turn.release()
+            me.turn.acquire()
+        if self.failure is not None:
+            if me is self.main:
+                raise self.failure
+            raise Cancelled()
+
+    def hand_over(self):
+        ''' Hands the turn to the next ready task for good, as a task ends
+        '''
+        try:
+            task = self.next_ready()
+        except ParsingException as e:
+            self.failure = e
+            task = self.main
+        self.current = task
+        task.turn.release()
+
+    ##### builtins #####
+
+    def spawn(self, name, args):
+        task = self.new_task()
+        def run():
+            task.turn.acquire()
+            local.task = task
+            local.program = self.program
+            try:
+                if self.failure is None:
+                    task.result = self.program.call(name, args)
+            except Cancelled:
+                return
+            except RecursionError:
+                task.error = ParsingException(parser.RECURSION_ERROR)
+            except BaseException as e:
+                task.error = e
+            task.done = True
+            if self.failure is None:
+                self.ready.extend(task.waiters)
+                self.hand_over()
+        parser.start_thread(run)
+        self.ready.append(task)
+        return task.number
+
+    def wait(self, number):
+        if not isinstance(number, int) or not 1 <= number < len(self.tasks): # 0 is the program itself
+            fail(f'task.wait: there is no task {number!r}')
+        task = self.tasks[number]
+        if task is self.current:
+            fail(f"task.wait: task {number} can't wait for itself")
+        if not task.done:
+            task.waiters.append(self.current)
+            self.switch()
+        if task.error is not None:
+            raise task.error
+        return task.result
+
+    def give_turn(self):
+        self.ready.append(self.current)
+        self.switch()
+
+    def wait_for(self, fd, writing):
+        ''' Suspends the running task until fd can be read (or written) without blocking. Returns False if fd
+            can't be waited for, like a regular file, which never blocks for long.
+        '''
+        waiting = self.writers if writing else self.readers
+        suspended = waiting.get(fd, None)
+        if suspended is None: # the loop holds one callback per descriptor, for every task waiting on it
+            try:
+                if writing:
+                    self.loop.add_writer(fd, self.resume, fd, writing)
+                else:
+                    self.loop.add_reader(fd, self.resume, fd, writing)
+            except (OSError, ValueError):
+                return False
+            suspended = waiting[fd] = []
+        suspended.append(self.current)
+        self.io_waits += 1
+        self.switch()
+        return True
+
+    def resume(self, fd, writing):
+        if writing:
+            self.loop.remove_writer(fd)
+            suspended = self.writers.pop(fd)
+        else:
+            self.loop.remove_reader(fd)
+            suspended = self.readers.pop(fd)
+        self.io_waits -= len(suspended)
+        self.ready.extend(suspended)
+        self.wake()
+
+    ##### ending #####
+
+    def finish(self):
+        ''' Waits for every task as the program ends, failing with the first error of a task nobody waited for
+        '''
+        for task in self.tasks[1:]:
+            self.wait(task.number)
+
+    def cancel(self, error):
+        ''' Ends the threads of the suspended tasks, as the program failed with error
+        '''
+        if self.failure is None:
+            self.failure = error
+        for task in self.tasks[1:]:
+            if not task.done:
+                task.turn.release()
+
+    def close(self):
+        self.loop.close()# }}}
+
+
+##### running programs #####
+#==========================#
+
+@contextlib.contextmanager
+def program(functions, call, check_calls=None):# {{{
+    ''' Runs the block as the Program of the thread, and waits for the tasks it spawned once the block is done
+        (or cancels them if it failed)
+    '''
+    global active
+    local.program = Program(functions, call, check_calls)
+    local.task = None
+    try:
+        yield
+        task = local.task
+        if task is not None:
+            task.scheduler.finish()
+    except BaseException as e:
+        task = local.task
+        if task is not None:
+            task.scheduler.cancel(e)
+        raise
+    finally:
+        task = local.task
+        cleanups = local.program.cleanups
+        local.program = local.task = None
+        if task is not None:
+            task.scheduler.close()
+            active -= 1
+        for cleanup in cleanups:
+            cleanup()# }}}
+
+def running(builtin):# {{{
+    ''' Returns the Program running on this thread, for builtin
+    '''
+    program = getattr(local, 'program', None)
+    if program is None:
+        fail(f'{builtin} only works in a running program')
+    return program# }}}
+
+def scheduler():# {{{
+    ''' Returns the scheduler of the running program, creating it on its first task
+    '''
+    global active
+    task = getattr(local, 'task', None)
+    if task is not None:
+        return task.scheduler
+    s = Scheduler(running('task.spawn'))
+    local.task = s.main
+    active += 1
+    return s# }}}
+
+def find_function(functions, name, nargs, builtin='task.spawn', check_calls=None):# {{{
+    ''' Returns the function name, which builtin runs. A name without a module is one of the main file's.
+        check_calls, if given, fails if the program couldn't call name itself.
+    '''
+    if not isinstance(name, str):
+        fail(f'{builtin} expected a function name, but got {name!r}')
+    if '.' not in name:
+        name = 'main.' + name
+    func = functions.get(name, None)
+    if func is None:
+        fail(f"Unknown function '{name}'")
+    if check_calls is not None:
+        check_calls([name])
+    if not func.is_defined():
+        fail(f"Function '{name}' declared, but undefined")
+    error = parser.arity_error(func, name, nargs)
+    if error is not None:
+        fail(error)
+    return func# }}}
+
+def wait_readable(fd):# {{{
+    ''' Suspends the running task until fd has input, returns False if it isn't a task or fd can't be waited for
+    '''
+    task = getattr(local, 'task', None)
+    return task is not None and task.scheduler.wait_for(fd, False)# }}}
+
+def wait_writable(fd):# {{{
+    task = getattr(local, 'task', None)
+    return task is not None and task.scheduler.wait_for(fd, True)# }}}
+
+
+##### builtins #####
+#==================#
+
+def spawn(_name, *_args):
+    func = running('task.spawn').find(_name, len(_args), 'task.spawn')
+    return scheduler().spawn(func.name, _args)
+
+def wait(_task):
+    return scheduler().wait(_task)
+
+def give_turn():
+    task = getattr(local, 'task', None)
+    if task is not None: # with no other task, there's nobody to give the turn to
+        task.scheduler.give_turn()
+    return 0
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+''' Vectors of integers behind the vector.* builtins, so bulk numeric work is one call over a whole vector
+    instead of a while loop of integer.* calls
+'''
+from array import array
+from lexer import fail
+
+
+class Vector:# {{{
+    ''' A vector of integers, passed by reference like a file descriptor: vector.set changes it in place,
+        and everything holding it sees the change. The items are kept in an array of 64 bit ints while
+        they all fit, and in a list of Python ints once one doesn't, so nothing ever overflows.
+    '''
+    __slots__ = ('items',)
+    __hash__ = None # changes in place, so it can't be a memoization key
+
+    def __init__(self, items):
+        self.items = items
+
+    @classmethod
+    def of(cls, values):
+        ''' Returns a vector of the list values, in an array if they fit
+        '''
+        try:
+            return cls(array('q', values))
+        except OverflowError:
+            return cls(values)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __str__(self):
+        return '[' + ', '.join(map(str, self.items)) + ']'
+
+    def __repr__(self):
+        return f'Vector({self})'
+
+    def get(self, index):
+        return self.items[self.check_index(index)]
+
+    def set(self, index, value):
+        index = self.check_index(index)
+        if not isinstance(value, int): # checked here, since once items is a list it would take anything
+            fail(f'Vectors hold integers, not {value!r}')
+        try:
+            self.items[index] = value
+        except OverflowError: # too big for the array from now on
+            self.items = list(self.items)
+            self.items[index] = value
+
+    def check_index(self, index):
+        if not isinstance(index, int) or not 0 <= index < len(self.items):
+            fail(f'Index {index} out of range of a vector of length {len(self.items)}')
+        return index# }}}
+
+def as_vector(value, name):# {{{
+    if not isinstance(value, Vector):
+        fail(f'{name} expected a vector, but got {value!r}')
+    return value# }}}
+
+
+##### builtins #####
+#==================#
+
+def new(_size):
+    if not isinstance(_size, int) or _size < 0:
+        fail(f'vector.new expected a size of at least 0, but got {_size!r}')
+    return Vector(array('q', bytes(8 * _size))) # zeroed
+
+def length(_vector):
+    return len(as_vector(_vector, 'vector.length'))
+
+def get_item(_vector, _index):
+    return as_vector(_vector, 'vector.get').get(_index)
+
+def set_item(_vector, _index, _value):
+    as_vector(_vector, 'vector.set').set(_index, _value)
+    return _vector
+
+def total(_vector):
+    return sum(as_vector(_vector, 'vector.sum').items) # Python ints, exact however big
+
+def add(_vector_a, _vector_b):
+    a = as_vector(_vector_a, 'vector.add').items
+    b = as_vector(_vector_b, 'vector.add').items
+    if len(a) != len(b):
+        fail(f'vector.add of vectors of lengths {len(a)} and {len(b)}')
+    return Vector.of(list(map(int.__add__, a, b)))
+
+def map_add(_vector, _value):
+    items = as_vector(_vector, 'vector.map_add').items
+    if not isinstance(_value, int):
+        fail(f'vector.map_add expected an integer, but got {_value!r}')
+    return Vector.of([x + _value for x in items])
@@ -0,0 +1,602 @@
+#!/usr/bin/python3
+''' Bytecode backend: compiles the parsed statement lists into flat bytecode and runs it on a stack
+    based virtual machine, with its own call frames instead of Python recursion.
+'''
+from array import array
+from lexer import fail
+import parser
+import tasks
+
+MAX_CALL_DEPTH = 1000000    # frame records on the VM's call stack before it gives up
+
+
+##### opcodes #####
+#=================#
+
+# an instruction is its opcode followed by its arguments, one int each in the code array. Most take one, the
+# fused ones several, and a jump target always comes first. Constants are kept in the frame after the
+# variables, so an argument naming a value is always a frame slot, whether it's a variable or a constant.
+LOAD_SLOT = 0       # push frame[arg]
+STORE_SLOT = 1      # pop into frame[arg]
+STORE_ONE = 2       # pop into frame[arg], unwrapping a list or tuple of exactly one value
+DECLARE_ONE = 3     # same as STORE_ONE, but only lists are unwrapped, like a var declaration of one name does
+CALL = 4            # call functions[arg], its argument count is known from its code
+CALL_BUILTIN = 5    # call builtins[arg], same as above
+POP = 6             # discard the top of the stack
+JUMP = 7            # continue at arg
+JUMP_IF_FALSE = 8   # pop, and continue at arg if it's falsy
+JUMP_IF_TRUE = 9    # pop, and continue at arg if it's truthy
+UNPACK = 10         # pop a list/tuple (or a single value) and push its arg values, last one first
+UNPACK_LIST = 11    # same as UNPACK, but only lists are unpacked, like var declarations do
+FAIL = 12           # fail with frame[arg] as the message
+RETURN = 13         # return the function outputs to the caller
+ADD = 14            # pop b and a, push a + b (inlined integer.add)
+SUBTRACT = 15       # pop b and a, push a - b (inlined integer.subtract)
+MULTIPLY = 16       # pop b and a, push a * b (inlined integer.multiply)
+EQUAL = 17          # pop b and a, push a == b (inlined integer.equal)
+ADD_SLOTS = 18      # a, b: push frame[a] + frame[b]
+SUBTRACT_SLOTS = 19 # a, b: push frame[a] - frame[b]
+MULTIPLY_SLOTS = 20 # a, b: push frame[a] * frame[b]
+EQUAL_SLOTS = 21    # a, b: push frame[a] == frame[b]
+ADD_STORE = 22      # a, b, c: frame[c] = frame[a] + frame[b], like STORE_ONE
+SUBTRACT_STORE = 23 # a, b, c: frame[c] = frame[a] - frame[b], like STORE_ONE
+MULTIPLY_STORE = 24 # a, b, c: frame[c] = frame[a] * frame[b], like STORE_ONE
+JUMP_IF_EQUAL = 25      # target, a, b: continue at target if frame[a] == frame[b]
+JUMP_UNLESS_EQUAL = 26  # target, a, b: continue at target unless frame[a] == frame[b]
+
+OPNAMES = ['LOAD_SLOT', 'STORE_SLOT', 'STORE_ONE', 'DECLARE_ONE', 'CALL', 'CALL_BUILTIN', 'POP', 'JUMP',
+           'JUMP_IF_FALSE', 'JUMP_IF_TRUE', 'UNPACK', 'UNPACK_LIST', 'FAIL', 'RETURN', 'ADD', 'SUBTRACT', 'MULTIPLY',
+           'EQUAL', 'ADD_SLOTS', 'SUBTRACT_SLOTS', 'MULTIPLY_SLOTS', 'EQUAL_SLOTS', 'ADD_STORE', 'SUBTRACT_STORE',
+           'MULTIPLY_STORE', 'JUMP_IF_EQUAL', 'JUMP_UNLESS_EQUAL']
+ARGUMENTS = [1] * ADD_SLOTS + [2, 2, 2, 2, 3, 3, 3, 3, 3] # of each opcode
+
+# operations with an opcode of their own, the other inlined builtins run as CALL_BUILTIN
+NATIVE_OPCODES = {
+    'integer.add': ADD,
+    'integer.subtract': SUBTRACT,
+    'integer.multiply': MULTIPLY,
+    'integer.equal': EQUAL,
+}
+SLOTS_OPCODES = {ADD: ADD_SLOTS, SUBTRACT: SUBTRACT_SLOTS, MULTIPLY: MULTIPLY_SLOTS, EQUAL: EQUAL_SLOTS}
+STORE_OPCODES = {ADD: ADD_STORE, SUBTRACT: SUBTRACT_STORE, MULTIPLY: MULTIPLY_STORE}
+
+
+class Code:# {{{
+    ''' Compiled bytecode of one function, or of the program section
+    '''
+    def __init__(self, name, frame_size, input_slots, output_slots, cache=None):
+        self.name = name
+        self.code = array('l')
+        self.lines = array('l') # line number of each int of the code, for errors
+        self.consts = []        # in the frame from slot frame_size on
+        self.const_slots = {}   # (type, value) -> slot, so each constant is in the frame once
+        self.frame_size = frame_size
+        self.input_slots = input_slots
+        self.output_slots = output_slots
+        self.output_slot = output_slots[0] if len(output_slots) == 1 else None
+        self.cache = cache # the function's parser.CallCache, if it's memoized
+        self.frame = None  # a new frame of the function, copied by each call, see finish()
+
+    def emit(self, op, arg=0, linenum=0):
+        return self.emit_many(op, (arg,), linenum)
+
+    def emit_many(self, op, args, linenum=0):
+        at = len(self.code)
+        self.code.append(op)
+        self.code.extend(args)
+        self.lines.extend([linenum or 0] * (1 + len(args)))
+        return at
+
+    def patch(self, at, target):
+        self.code[at + 1] = target
+
+    def here(self):
+        return len(self.code)
+
+    def const(self, value):
+        ''' Returns the slot of the constant value
+        '''
+        key = (type(value), value)
+        slot = self.const_slots.get(key, None)
+        if slot is None:
+            slot = self.const_slots[key] = self.frame_size + len(self.consts)
+            self.consts.append(value)
+        return slot
+
+    def finish(self):
+        self.frame = [None] * self.frame_size + self.consts
+
+    def dump(self):
+        ''' Returns a human readable listing of the bytecode
+        '''
+        out = [f'{self.name}: frame of {self.frame_size}']
+        pc = 0
+        while pc < len(self.code):
+            op = self.code[pc]
+            args = list(self.code[pc + 1:pc + 1 + ARGUMENTS[op]])
+            if op in (LOAD_SLOT, STORE_SLOT, STORE_ONE, DECLARE_ONE, FAIL) or ADD_SLOTS <= op <= MULTIPLY_STORE:
+                slots = args
+            else:
+                slots = args[1:] if op >= JUMP_IF_EQUAL else []
+            consts = [repr(self.consts[a - self.frame_size]) for a in slots if a >= self.frame_size]
+            extra = f"  ({', '.join(consts)})" if consts else ''
+            out.append(f"  {pc:5} {OPNAMES[op]:17} {' '.join(map(str, args))}{extra}")
+            pc += 1 + ARGUMENTS[op]
+        return '\n'.join(out)# }}}
+
+
+##### compiler #####
+#==================#
+
+class Compiler:# {{{
+    ''' Turns the resolved statements into Code objects. User functions and builtins are referred to
+        by their index in self.functions and self.builtins.
+    '''
+    def __init__(self, known_functions):
+        self.known_functions = known_functions
+        self.functions = []
+        self.function_index = {}
+        self.builtins = []
+        self.builtin_index = {}
+        self.pending = []   # functions referred to, but not compiled yet
+
+    def function_ref(self, func):
+        if func.name not in self.function_index:
+            self.function_index[func.name] = len(self.functions)
+            self.functions.append(None) # filled in by compile_function
+            self.pending.append(func)
+        return self.function_index[func.name]
+
+    def builtin_ref(self, func, nargs=None):
+        ''' A variadic builtin gets an entry for each number of arguments it's called with
+        '''
+        nargs = len(func.inputs) if nargs is None else nargs
+        key = (func.name, nargs)
+        if key not in self.builtin_index:
+            self.builtin_index[key] = len(self.builtins)
+            self.builtins.append((func.func, nargs))
+        return self.builtin_index[key]
+
+    def compile_function(self, func):
+        func.resolve()
+        code = Code(func.name, func.frame_size, func.input_slots, func.output_slots, func.cache)
+        self.tail_block(code, func.statements, func)
+        code.emit(RETURN)
+        code.finish()
+        self.functions[self.function_ref(func)] = code
+
+    def compile_called(self):
+        ''' Compiles the functions referred to by the code compiled so far, and the ones they refer to, so
+            functions which are never called (most of an imported module, say) are never compiled
+        '''
+        while self.pending:
+            self.compile_function(self.pending.pop())
+
+    def compile_statements(self, statements, scope):
+        ''' Compiles statements of the program section, resolved in scope, which may already hold the
+            variables of statements compiled before them
+        '''
+        parser.resolve_block(statements, scope, new_block=False)
+        code = Code('program', scope.size, [], [])
+        self.block(code, statements)
+        code.emit(RETURN)
+        return code
+
+    def compile_program(self, statements):
+        program = self.compile_statements(statements, parser.Scope())
+        self.compile_called()
+        return program
+
+    def block(self, code, statements):
+        for s in statements:
+            if isinstance(s, list):
+                self.block(code, s)
+            else:
+                self.statement(code, s)
+
+    def tail_block(self, code, statements, func):
+        ''' Compiles the body of func, turning self tail calls in its last statement into a jump back to
+            the start of the function
+        '''
+        if not statements:
+            return
+        self.block(code, statements[:-1])
+        last = statements[-1]
+        if isinstance(last, list):
+            self.tail_block(code, last, func)
+        elif isinstance(last, parser.IfElseStatement):
+            self.if_else(code, last, func)
+        elif isinstance(last, parser.AssignStatement) and last.is_tail_call(func):
+            for a in last.expr.args:
+                self.expression(code, a)
+            for slot in reversed(func.input_slots):
+                code.emit(STORE_SLOT, slot, last.linenum)
+            for slot in func.output_slots:
+                code.emit(LOAD_SLOT, code.const(None), last.linenum)
+                code.emit(STORE_SLOT, slot, last.linenum)
+            code.emit(JUMP, 0, last.linenum)
+        else:
+            self.statement(code, last)
+
+    def branch(self, code, statements, tail_of):
+        if tail_of is None:
+            self.block(code, statements)
+        else:
+            self.tail_block(code, statements, tail_of)
+
+    def if_else(self, code, s, tail_of=None):
+        else_jump = self.condition(code, s.condition, False, s.linenum)
+        self.branch(code, s.true_statements, tail_of)
+        if s.false_statements:
+            end_jump = code.emit(JUMP, 0, s.linenum)
+            code.patch(else_jump, code.here())
+            self.branch(code, s.false_statements, tail_of)
+            code.patch(end_jump, code.here())
+        else:
+            code.patch(else_jump, code.here())
+
+    def statement(self, code, s):
+        if isinstance(s, parser.AssignStatement):
+            if len(s.slots) == 1 and s.slots[0] is not None:
+                e = s.expr
+                op = NATIVE_OPCODES.get(e.name, None) if e.kind == 'operation' else None
+                operands = self.operands(code, e.args) if op in STORE_OPCODES else None
+                if operands is not None:
+                    code.emit_many(STORE_OPCODES[op], operands + [s.slots[0]], s.linenum)
+                else:
+                    self.expression(code, e)
+                    code.emit(STORE_ONE, s.slots[0], s.linenum)
+                return
+            self.expression(code, s.expr)
+            code.emit(UNPACK, len(s.names), s.linenum)
+            for n, slot in zip(s.names, s.slots):
+                if slot is None:
+                    code.emit(FAIL, code.const(f"Variable '{n}' hasn't been defined."), s.linenum)
+                else:
+                    code.emit(STORE_SLOT, slot, s.linenum)
+        elif isinstance(s, parser.VariableDeclaration):
+            self.expression(code, s.expr)
+            if len(s.names) == 1 and s.redeclared is None:
+                code.emit(DECLARE_ONE, s.slots[0], s.linenum)
+                return
+            # a single name keeps a tuple (e.g. from integer.divide) whole, several names unpack it
+            code.emit(UNPACK_LIST if len(s.names) == 1 else UNPACK, len(s.names), s.linenum)
+            if s.redeclared is not None:
+                code.emit(FAIL, code.const(f"Variable '{s.redeclared}' already declared."), s.linenum)
+            for slot in s.slots:
+                code.emit(STORE_SLOT, slot, s.linenum)
+        elif isinstance(s, parser.WhileStatement): # the condition goes after the body, so it's one jump a turn
+            enter_jump = code.emit(JUMP, 0, s.linenum)
+            start = code.here()
+            self.block(code, s.statements)
+            code.patch(enter_jump, code.here())
+            code.patch(self.condition(code, s.condition, True, s.linenum), start)
+        elif isinstance(s, parser.IfElseStatement):
+            self.if_else(code, s)
+        elif isinstance(s, parser.FunctionCallStatement):
+            self.call(code, s.name, s.args, s.linenum)
+            code.emit(POP, 0, s.linenum)
+        else:
+            fail(f"Can't compile statement {s!r}", getattr(s, 'linenum', None))
+
+    def expression(self, code, e):
+        if e.kind == 'value':
+            code.emit(LOAD_SLOT, code.const(e.value), e.linenum)
+        elif e.kind == 'variable':
+            if e.slot is None:
+                message = f'Variable {e.name} not found in active parameters or current scope'
+                code.emit(FAIL, code.const(message), e.linenum)
+            else:
+                code.emit(LOAD_SLOT, e.slot, e.linenum)
+        elif e.kind == 'function':
+            self.call(code, e.name, e.args, e.linenum)
+        elif e.kind == 'operation':
+            op = NATIVE_OPCODES.get(e.name, None)
+            operands = self.operands(code, e.args) if op is not None else None
+            if operands is not None:
+                code.emit_many(SLOTS_OPCODES[op], operands, e.linenum)
+                return
+            for a in e.args:
+                self.expression(code, a)
+            if op is not None:
+                code.emit(op, 0, e.linenum)
+            else:
+                code.emit(CALL_BUILTIN, self.builtin_ref(self.known_functions[e.name]), e.linenum)
+        else:
+            fail(f"Unknown expression kind '{e.kind}'", e.linenum)
+
+    def operands(self, code, args):
+        ''' Returns the slots of args if they're all variables or constants, which fused instructions take
+            straight from the frame, and None otherwise
+        '''
+        for a in args:
+            if not (a.kind == 'value' or a.kind == 'variable' and a.slot is not None):
+                return None
+        return [code.const(a.value) if a.kind == 'value' else a.slot for a in args]
+
+    def comparison(self, code, e):
+        ''' Returns the slots of the operands of e if it's integer.equal of two variables or constants
+        '''
+        if e.kind == 'operation' and e.name == 'integer.equal' and len(e.args) == 2:
+            return self.operands(code, e.args)
+        return None
+
+    def condition(self, code, e, when, linenum):
+        ''' Emits a jump taken when e is truthy (or falsy, if when is False), and returns it to be patched
+            with its target. integer.equal of variables and constants compares and jumps in one
+            instruction, as does its negation, integer.equal(..., 0).
+        '''
+        if e.kind == 'operation' and e.name == 'integer.equal' and len(e.args) == 2:
+            a, b = e.args
+            for inner, zero in ((a, b), (b, a)):
+                if zero.kind == 'value' and type(zero.value) is int and zero.value == 0 \
+                        and self.comparison(code, inner) is not None:
+                    e, when = inner, not when
+                    break
+        operands = self.comparison(code, e)
+        if operands is not None:
+            return code.emit_many(JUMP_IF_EQUAL if when else JUMP_UNLESS_EQUAL, [0] + operands, linenum)
+        self.expression(code, e)
+        return code.emit(JUMP_IF_TRUE if when else JUMP_IF_FALSE, 0, linenum)
+
+    def call(self, code, name, args, linenum):
+        func = self.known_functions.get(name, None)
+        if func is None:
+            code.emit(FAIL, code.const(f"Unknown function '{name}'"), linenum)
+            return
+        if not func.is_defined():
+            code.emit(FAIL, code.const(f"Function '{name}' declared, but undefined"), linenum)
+            return
+        error = parser.arity_error(func, name, len(args))
+        if error is not None:
+            code.emit(FAIL, code.const(error), linenum)
+            return
+        for a in args:
+            self.expression(code, a)
+        if isinstance(func, parser.PythonFunction):
+            code.emit(CALL_BUILTIN, self.builtin_ref(func, len(args)), linenum)
+        else:
+            code.emit(CALL, self.function_ref(func), linenum)# }}}
+
+
+##### virtual machine #####
+#=========================#
+
+def one_value(value, current, pc):# {{{
+    ''' Returns value stored in a single variable, unwrapping a list or tuple of exactly one value. pc is past
+        the instruction storing it, for the error.
+    '''
+    if isinstance(value, list) or isinstance(value, tuple):
+        if len(value) != 1:
+            fail(f'Expected 1 values, but got {len(value)}', current.lines[pc - 1])
+        value = value[0]
+    return value# }}}
+
+class VM:# {{{
+    ''' Runs Code objects. The value stack is shared by all calls, and each call pushes a
+        (code, pc, frame, cache key) record onto frames instead of recursing in Python.
+
+        The instructions are tested for in about the order they're run most, and the fused ones (see
+        Compiler.condition and Compiler.operands) run a loop like while(integer.equal(integer.equal(i, n), 0))
+        { total = integer.add(total, i); i = integer.add(i, 1); } in three instructions a turn.
+    '''
+    def __init__(self, functions, builtins):
+        self.functions = functions
+        self.builtins = builtins
+
+    def run(self, program, frame=None):
+        ''' Runs program, in frame if it's given (where statements run before it left their variables)
+        '''
+        functions = self.functions
+        builtins = self.builtins
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        frames = []
+
+        current = program
+        code = current.code
+        if frame is None:
+            frame = [None] * current.frame_size
+        frame[current.frame_size:] = current.consts # the constants go after the variables
+        pc = 0
+
+        while True:
+            op = code[pc]
+            if op == LOAD_SLOT:
+                push(frame[code[pc + 1]])
+                pc += 2
+            elif op == ADD_STORE:
+                value = frame[code[pc + 1]] + frame[code[pc + 2]]
+                pc += 4
+                frame[code[pc - 1]] = value if type(value) is int else one_value(value, current, pc)
+            elif op == JUMP_UNLESS_EQUAL:
+                if frame[code[pc + 2]] == frame[code[pc + 3]]:
+                    pc += 4
+                else:
+                    pc = code[pc + 1]
+            elif op == JUMP_IF_EQUAL:
+                if frame[code[pc + 2]] == frame[code[pc + 3]]:
+                    pc = code[pc + 1]
+                else:
+                    pc += 4
+            elif op == STORE_ONE:
+                value = pop()
+                pc += 2
+                frame[code[pc - 1]] = value if type(value) is int else one_value(value, current, pc)
+            elif op == SUBTRACT_SLOTS:
+                push(frame[code[pc + 1]] - frame[code[pc + 2]])
+                pc += 3
+            elif op == ADD_SLOTS:
+                push(frame[code[pc + 1]] + frame[code[pc + 2]])
+                pc += 3
+            elif op == CALL_BUILTIN:
+                func, nargs = builtins[code[pc + 1]]
+                pc += 2
+                if nargs:
+                    args = stack[-nargs:]
+                    del stack[-nargs:]
+                    push(func(*args))
+                else:
+                    push(func())
+            elif op == CALL:
+                callee = functions[code[pc + 1]]
+                pc += 2
+                nargs = len(callee.input_slots)
+                args = stack[len(stack) - nargs:]
+                del stack[len(stack) - nargs:]
+                key = None
+                cache = callee.cache
+                if cache is not None: # memoized pure function, see parser.CallCache
+                    key = cache.key(args)
+                    try:
+                        result = cache.entries.get(key, cache)
+                    except TypeError: # an unhashable argument can't be a key, so just make the call
+                        key = None
+                        result = cache
+                    if result is not cache:
+                        cache.hits += 1
+                        cache.entries.move_to_end(key)
+                        push(result)
+                        continue
+                    if key is not None:
+                        cache.misses += 1
+                frames.append((current, pc, frame, key))
+                if len(frames) > MAX_CALL_DEPTH:
+                    fail(parser.RECURSION_MESSAGE, current.lines[pc - 1])
+                frame = callee.frame[:] # outputs start as None, like every variable
+                for slot, value in zip(callee.input_slots, args):
+                    frame[slot] = value
+                current, code, pc = callee, callee.code, 0
+            elif op == RETURN:
+                if not frames:
+                    return
+                if current.output_slot is not None:
+                    outs = frame[current.output_slot]
+                else:
+                    outs = [frame[slot] for slot in current.output_slots]
+                caller, pc, frame, key = frames.pop()
+                if key is not None:
+                    current.cache.store(key, outs)
+                current = caller
+                code = current.code
+                push(outs)
+            elif op == DECLARE_ONE:
+                value = pop()
+                pc += 2
+                if isinstance(value, list):
+                    if len(value) != 1:
+                        fail(f'Expected 1 values, but got {len(value)}', current.lines[pc - 1])
+                    value = value[0]
+                frame[code[pc - 1]] = value
+            elif op == STORE_SLOT:
+                frame[code[pc + 1]] = pop()
+                pc += 2
+            elif op == JUMP:
+                pc = code[pc + 1]
+            elif op == JUMP_IF_FALSE:
+                pc = code[pc + 1] if not pop() else pc + 2
+            elif op == JUMP_IF_TRUE:
+                pc = code[pc + 1] if pop() else pc + 2
+            elif op == EQUAL_SLOTS:
+                push(frame[code[pc + 1]] == frame[code[pc + 2]])
+                pc += 3
+            elif op == MULTIPLY_SLOTS:
+                push(frame[code[pc + 1]] * frame[code[pc + 2]])
+                pc += 3
+            elif op == SUBTRACT_STORE:
+                value = frame[code[pc + 1]] - frame[code[pc + 2]]
+                pc += 4
+                frame[code[pc - 1]] = value if type(value) is int else one_value(value, current, pc)
+            elif op == MULTIPLY_STORE:
+                value = frame[code[pc + 1]] * frame[code[pc + 2]]
+                pc += 4
+                frame[code[pc - 1]] = value if type(value) is int else one_value(value, current, pc)
+            elif op == ADD:
+                b = pop()
+                stack[-1] = stack[-1] + b
+                pc += 2
+            elif op == SUBTRACT:
+                b = pop()
+                stack[-1] = stack[-1] - b
+                pc += 2
+            elif op == EQUAL:
+                b = pop()
+                stack[-1] = stack[-1] == b
+                pc += 2
+            elif op == MULTIPLY:
+                b = pop()
+                stack[-1] = stack[-1] * b
+                pc += 2
+            elif op == POP:
+                pop()
+                pc += 2
+            elif op == UNPACK or op == UNPACK_LIST:
+                arg = code[pc + 1]
+                pc += 2
+                values = pop()
+                if op == UNPACK:
+                    if not isinstance(values, list) and not isinstance(values, tuple):
+                        values = [values]
+                elif not isinstance(values, list):
+                    values = [values]
+                if len(values) != arg:
+                    fail(f'Expected {arg} values, but got {len(values)}', current.lines[pc - 1])
+                stack.extend(reversed(values))
+            elif op == FAIL:
+                fail(frame[code[pc + 1]], current.lines[pc] or None)
+            else:
+                fail(f'Unknown opcode {op} in {current.name}')# }}}
+
+
+def function_caller(functions, compiler, machine):# {{{
+    ''' Returns how a task spawned by the program calls a function of its table, see tasks.py. The function
+        is called by a little program of its own, which stores its outputs in the frame.
+    '''
+    def call(name, args):
+        func = tasks.find_function(functions, name, len(args))
+        if isinstance(func, parser.PythonFunction):
+            return func.call(*args)
+        code = Code('task', 1, [], [])
+        for value in args:
+            code.emit(LOAD_SLOT, code.const(value))
+        code.emit(CALL, compiler.function_ref(func))
+        code.emit(STORE_SLOT, 0)
+        code.emit(RETURN)
+        compiler.compile_called()
+        frame = [None]
+        machine.run(code, frame)
+        return frame[0]
+    return call# }}}
+
+def compile_program(functions, statements, check_calls=None):# {{{
+    ''' Compiles the parsed program into bytecode, and returns the closure which runs it on a VM. check_calls
+        is as in parser.compile_program.
+    '''
+    compiler = Compiler(functions)
+    program = compiler.compile_program(statements)
+    machine = VM(compiler.functions, compiler.builtins)
+
+    def run_program():
+        with tasks.program(functions, function_caller(functions, compiler, machine), check_calls):
+            machine.run(program)
+    return run_program# }}}
+
+def compile_stream(functions, statements, check_calls=None):# {{{
+    ''' Like compile_program, but statements is a function returning an iterator over the program section,
+        and each statement it yields is compiled and run before the next one is asked for
+    '''
+    compiler = Compiler(functions)
+    machine = VM(compiler.functions, compiler.builtins)
+
+    def run_program():
+        scope = parser.Scope()
+        frame = []
+        with tasks.program(functions, function_caller(functions, compiler, machine), check_calls):
+            for s in statements():
+                code = compiler.compile_statements([s], scope)
+                compiler.compile_called()
+                if len(frame) < scope.size:
+                    frame.extend([None] * (scope.size - len(frame)))
+                machine.run(code, frame)
+    return run_program# }}}